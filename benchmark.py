@@ -0,0 +1,333 @@
+"""Синтетический журнал плавок и замеры производительности расчетов.
+
+    python benchmark.py generate plavka.xlsx --rows 100000 --flasks 11
+    python benchmark.py run --rows 1000 10000 100000 -o bench.json
+    python benchmark.py run --rows 100000 --compare bench_old.json
+    python benchmark.py startup --repeat 5 --budget-ms 1500
+
+generate создает журнал плавок в том же виде, что и настоящий plavka.xlsx:
+номер плавки, дата плавки и колонки секторов с номерами опок.
+
+run для каждого размера журнала генерирует файл во временном каталоге и
+замеряет этапы, из которых состоят обновление окна (update_table), пересчет
+(main.py recalc) и экспорт (export_table): холодную загрузку из Excel,
+загрузку из бинарной копии, последнее использование, использования после
+ремонта, таблицу месяца, пересчет счетчиков по журналам ремонтов и плавок
+(как recalc, без записи истории) и выгрузку таблицы
+использований usages по всему журналу в csv, xlsx и parquet (parquet - если
+установлен pyarrow). Замеры выполняются без Qt. Результаты сохраняются в JSON;
+с --compare выводится отношение ко времени из прошлого файла результатов.
+
+startup запускает окно программы в отдельном процессе (холодный импорт) и
+замеряет время до его первой отрисовки; main.py --startup-report записывает
+момент отрисовки и завершает программу. Если медиана превышает --budget-ms,
+команда завершается с кодом 1, так что замер можно ставить проверкой перед
+сборкой PyInstaller; собранную программу можно замерить через --exe.
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from opoka_records import DATE_COLUMN, FleetConfig
+
+BENCHMARKS = ['load_excel', 'load_sidecar', 'last_use', 'since_repair',
+              'month_grid', 'recalc', 'export_csv', 'export_xlsx', 'export_parquet']
+
+
+def sector_columns(count):
+    return [f'Сектор_{letter}_опоки' for letter in string.ascii_uppercase[:count]]
+
+
+def generate_plavka(path, rows, flasks=11, sectors=4, fill_rate=0.7,
+                    start='2023-01-01', days=1000, date_style='text', seed=0):
+    """Записывает синтетический журнал плавок в xlsx.
+
+    fill_rate - доля заполненных ячеек секторов, даты плавок равномерно
+    распределены по days дням от start и идут по возрастанию. date_style
+    'text' пишет даты строками ДД.ММ.ГГГГ, как в выгрузке цеха, 'date' -
+    датами Excel.
+    """
+    import openpyxl
+
+    rng = np.random.default_rng(seed)
+    start_date = datetime.strptime(start, '%Y-%m-%d')
+    day_offsets = np.sort(rng.integers(0, days, rows))
+    opokas = rng.integers(1, flasks + 1, (rows, sectors))
+    filled = rng.random((rows, sectors)) < fill_rate
+
+    # Записываем потоково, чтобы не держать в памяти весь лист
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Номер_плавки', DATE_COLUMN] + sector_columns(sectors))
+
+    dates = {}
+    for row in range(rows):
+        offset = int(day_offsets[row])
+        if offset not in dates:
+            date = start_date + timedelta(days=offset)
+            dates[offset] = date.strftime('%d.%m.%Y') if date_style == 'text' else date
+        cells = [int(opokas[row, col]) if filled[row, col] else None
+                 for col in range(sectors)]
+        sheet.append([row + 1, dates[offset]] + cells)
+
+    workbook.save(path)
+
+
+def measure(func, repeat):
+    """Выполняет func repeat раз, возвращает времена в секундах"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def remove_caches(data_manager):
+    for path in (data_manager.sidecar_file, data_manager.aggregates_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_size(args, rows):
+    """Замеры для одного размера журнала; выполняется в каталоге с plavka.xlsx"""
+    from opoka_data import (HAS_FEATHER, DataCache, HistoryStore, OpokaDataManager,
+                            apply_usage_stats, collect_repair_dates)
+    from opoka_export import export_table
+    from opoka_journal import REPAIR_OUT, REPAIR_RETURN
+
+    fleet = FleetConfig(range(1, args.flasks + 1), sector_columns(args.sectors))
+    data_manager = OpokaDataManager(fleet)
+    generate_plavka(data_manager.excel_file, rows, args.flasks, args.sectors,
+                    args.fill_rate, args.start, args.days, args.date_style)
+
+    def load_excel():
+        remove_caches(data_manager)
+        data_manager.load_plavka()
+
+    # Холодная загрузка заодно строит бинарную копию для остальных замеров
+    results = {'load_excel': measure(load_excel, args.repeat)}
+    results['load_sidecar'] = measure(data_manager.load_plavka, args.repeat)
+    # Ремонт каждой опоки в середине журнала, как после ручного ввода ремонтов
+    middle = (datetime.strptime(args.start, '%Y-%m-%d') + timedelta(days=args.days // 2))
+    for i in fleet.opoka_nums:
+        data_manager.repair_journal.append(REPAIR_OUT, i, middle.strftime('%Y-%m-%d'))
+        data_manager.repair_journal.append(REPAIR_RETURN, i, middle.strftime('%Y-%m-%d'))
+    repair_dates = {i: middle for i in fleet.opoka_nums}
+    # История остается в памяти: файл истории бенчмарку не нужен
+    history_store = HistoryStore(data_manager)
+    atexit.unregister(history_store.flush)
+
+    def recalc():
+        data_manager.repair_journal.rebuild()
+        repairs = data_manager.load_repairs()
+        usage_stats = data_manager.usage_stats(
+            fleet.opoka_nums, collect_repair_dates(repairs, fleet.opoka_nums)
+        )
+        apply_usage_stats(history_store, usage_stats, repairs, fleet.opoka_nums,
+                          fleet.repair_limit)
+
+    results['last_use'] = measure(
+        lambda: [data_manager.last_use(i) for i in fleet.opoka_nums], args.repeat
+    )
+    results['since_repair'] = measure(
+        lambda: data_manager.usage_stats(fleet.opoka_nums, repair_dates), args.repeat
+    )
+    results['month_grid'] = measure(
+        lambda: data_manager.aggregates.month_grid(middle.year, middle.month, fleet.opoka_nums),
+        args.repeat
+    )
+    results['recalc'] = measure(recalc, args.repeat)
+    history = history_store.get()
+
+    # Выгрузка использований тем же путем, что и команда export: частями из
+    # компактного журнала
+    data_cache = DataCache(data_manager)
+    formats = ['csv', 'xlsx'] + (['parquet'] if HAS_FEATHER else [])
+    for extension in formats:
+        results[f'export_{extension}'] = measure(
+            lambda: export_table(f'usages.{extension}', 'usages', data_cache, history),
+            args.repeat
+        )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "flasks": args.flasks, "sectors": args.sectors, "fill_rate": args.fill_rate,
+            "start": args.start, "days": args.days, "date_style": args.date_style,
+            "repeat": args.repeat
+        },
+        "results": []
+    }
+
+    cwd = os.getcwd()
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory(prefix='opoka_bench_') as workdir:
+            os.chdir(workdir)
+            try:
+                results = run_size(args, rows)
+            finally:
+                os.chdir(cwd)
+
+        for name in BENCHMARKS:
+            if name not in results:
+                # Замер недоступен без необязательного пакета
+                continue
+            times = results[name]
+            report["results"].append({
+                "name": name,
+                "rows": rows,
+                "min": min(times),
+                "median": statistics.median(times),
+                "mean": statistics.fmean(times),
+                "times": times
+            })
+            print(f"{rows:>8} {name:<14} {min(times) * 1000:10.3f} мс", flush=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        compare_reports(args.compare, report)
+    return 0
+
+
+def compare_reports(baseline_file, report):
+    """Печатает отношение минимального времени к прошлому замеру (>1 - медленнее)"""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(item["name"], item["rows"]): item["min"] for item in baseline["results"]}
+
+    print(f"Сравнение с {baseline.get('commit') or baseline_file}:")
+    for item in report["results"]:
+        key = (item["name"], item["rows"])
+        if key in previous and previous[key] > 0:
+            ratio = item["min"] / previous[key]
+            print(f"{item['rows']:>8} {item['name']:<14} x{ratio:.2f}")
+
+
+def run_startup(args):
+    command = [args.exe] if args.exe else [sys.executable, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'main.py')]
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='opoka_startup_') as workdir:
+        report_file = os.path.join(workdir, 'startup.json')
+        for _ in range(args.repeat):
+            if os.path.exists(report_file):
+                os.remove(report_file)
+            started = time.time()
+            subprocess.run(command + ['--startup-report', report_file],
+                           timeout=args.timeout, check=True)
+            with open(report_file, encoding='utf-8') as f:
+                report = json.load(f)
+            # Время процесса включает запуск интерпретатора (или распаковку
+            # собранной программы), first_paint_ms - только импорт и окно
+            results.append({
+                "process_ms": (report["first_paint_time"] - started) * 1000,
+                "first_paint_ms": report["first_paint_ms"],
+                "modules": report["modules"]
+            })
+            print(f"запуск {results[-1]['process_ms']:8.0f} мс, "
+                  f"в процессе {report['first_paint_ms']:8.0f} мс, "
+                  f"загружены: {', '.join(report['modules'])}", flush=True)
+
+    median = statistics.median(item["process_ms"] for item in results)
+    print(f"Медиана до первой отрисовки: {median:.0f} мс (бюджет {args.budget_ms:.0f} мс)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "commit": git_commit(),
+                "created": datetime.now().isoformat(timespec='seconds'),
+                "command": command,
+                "budget_ms": args.budget_ms,
+                "median_ms": median,
+                "results": results
+            }, f, ensure_ascii=False, indent=4)
+    if median > args.budget_ms:
+        print("Бюджет времени запуска превышен", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_generate(args):
+    generate_plavka(args.path, args.rows[0], args.flasks, args.sectors, args.fill_rate,
+                    args.start, args.days, args.date_style, args.seed)
+    print(f"Журнал плавок записан в {args.path}")
+    return 0
+
+
+def add_data_options(parser, rows):
+    parser.add_argument('--rows', type=int, nargs='+', default=rows,
+                        help="количество плавок (для run - список размеров)")
+    parser.add_argument('--flasks', type=int, default=11, help="количество опок")
+    parser.add_argument('--sectors', type=int, default=4, help="количество секторов")
+    parser.add_argument('--fill-rate', type=float, default=0.7,
+                        help="доля заполненных ячеек секторов")
+    parser.add_argument('--start', default='2023-01-01', help="первая дата плавок ГГГГ-ММ-ДД")
+    parser.add_argument('--days', type=int, default=1000, help="период плавок в днях")
+    parser.add_argument('--date-style', choices=['text', 'date'], default='text',
+                        help="даты строками ДД.ММ.ГГГГ или датами Excel")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Замеры производительности учета опок")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="создать синтетический журнал плавок")
+    generate.add_argument('path', help="файл .xlsx")
+    generate.add_argument('--seed', type=int, default=0)
+    add_data_options(generate, [10000])
+    generate.set_defaults(handler=run_generate)
+
+    run = commands.add_parser('run', help="выполнить замеры")
+    add_data_options(run, [1000, 10000, 100000])
+    run.add_argument('--repeat', type=int, default=3, help="повторов каждого замера")
+    run.add_argument('-o', '--output', default='benchmark_results.json',
+                     help="файл результатов JSON")
+    run.add_argument('--compare', help="прошлый файл результатов для сравнения")
+    run.set_defaults(handler=run_benchmarks)
+
+    startup = commands.add_parser('startup', help="замерить запуск окна до первой отрисовки")
+    startup.add_argument('--repeat', type=int, default=5, help="количество запусков")
+    startup.add_argument('--budget-ms', type=float, default=1500,
+                         help="допустимая медиана времени запуска, мс")
+    startup.add_argument('--exe', help="собранная программа вместо python main.py")
+    startup.add_argument('--timeout', type=float, default=60, help="предел одного запуска, с")
+    startup.add_argument('-o', '--output', help="файл результатов JSON")
+    startup.set_defaults(handler=run_startup)
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    sys.exit(args.handler(args))
@@ -1,840 +1,333 @@
-import sys
-from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                              QHBoxLayout, QTableWidget, QTableWidgetItem, QLabel, 
-                              QComboBox, QPushButton, QHeaderView, QFrame, QMessageBox, QLineEdit, QGraphicsDropShadowEffect)
-from PySide6.QtCore import Qt, QSize, QPropertyAnimation, QEasingCurve
-from PySide6.QtGui import QColor, QIcon, QLinearGradient, QPalette
-import pandas as pd
-from datetime import datetime, timedelta
-import calendar
+"""Точка входа: окно учета опок или консольные команды.
+
+    python main.py                   - окно программы
+    python main.py recalc            - пересчитать счетчики по журналу плавок
+    python main.py export [-o FILE]  - выгрузить статистику (.xlsx, .csv или .parquet)
+    python main.py status [--json]   - показать состояние опок (--as-of ДАТА - на дату)
+    python main.py serve [--port N]  - локальный HTTP API только для чтения
+    python main.py repair out N      - записать ремонт опоки (return, correct, log)
+
+Консольные команды не создают QApplication. PySide6 и pandas импортируются
+только в тех ветках, где они нужны, поэтому --help и status запускаются быстро.
+"""
+import time
+
+START_TIME = time.perf_counter()
+
+import argparse
 import json
+import sys
+from datetime import date
 
-class OpokaDataManager:
-    def __init__(self):
-        self.filename = 'opoka_usage_history.json'
-        self.excel_file = 'plavka.xlsx'
-        
-    def load_history(self):
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-                # Добавляем дополнительные поля, если их нет
-                for key in data:
-                    if isinstance(data[key], (int, float)):
-                        data[key] = {
-                            "count": data[key],
-                            "total_count": data[key],
-                            "repair_count": 0,
-                            "last_use": None,
-                            "last_repair_date": None,  # Дата последнего ремонта
-                            "in_repair": False
-                        }
-                    elif "total_count" not in data[key]:
-                        data[key].update({
-                            "total_count": data[key]["count"],
-                            "repair_count": 0
-                        })
-                    elif "last_repair_date" not in data[key]:
-                        data[key].update({
-                            "last_repair_date": None
-                        })
-                return data
-        except FileNotFoundError:
-            return {str(i): {
-                "count": 0,
-                "total_count": 0,
-                "repair_count": 0,
-                "last_use": None,
-                "last_repair_date": None,
-                "in_repair": False
-            } for i in range(1, 12)}
-
-    def save_history(self, history):
-        with open(self.filename, 'w') as f:
-            json.dump(history, f, indent=4)
-
-class DataCache:
-    def __init__(self):
-        self.df = None
-        self.last_update = None
-        
-    def get_dataframe(self):
-        current_time = datetime.now()
-        if self.df is None or (current_time - self.last_update).seconds > 300:  # Обновляем каждые 5 минут
-            self.df = pd.read_excel('plavka.xlsx')
-            self.last_update = current_time
-        return self.df
-
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Учет использования опок")
-        self.setFixedSize(1370, 850)
-        
-        self.current_date = datetime.now()
-        self.opoka_data_manager = OpokaDataManager()
-        self.data_cache = DataCache()
-        
-        # Создаем верхнюю панель с двумя строками
-        header_widget = QWidget()
-        header_layout = QVBoxLayout(header_widget)
-        header_layout.setSpacing(5)
-        
-        # Первая строка верхней панели
-        top_row = QWidget()
-        top_layout = QHBoxLayout(top_row)
-        top_layout.setContentsMargins(0, 0, 0, 0)
-        
-        # Добавляем дату и кнопки
-        date_label = QLabel(f"Дата: {self.current_date.strftime('%d.%m.%Y')}")
-        date_label.setStyleSheet("font-size: 12px;")
-        
-        self.recalc_button = QPushButton("Пересчитать историю")
-        self.recalc_button.clicked.connect(self.recalculate_and_update)
-        
-        export_button = QPushButton("Экспорт статистики")
-        export_button.clicked.connect(self.export_statistics)
-        
-        # Обновленный стиль кнопок с иконками и анимацией
-        button_style = """
-            QPushButton {
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #2196F3, stop: 1 #1976D2
-                );
-                color: white;
-                border-radius: 4px;
-                padding: 5px 10px;
-                font-size: 11px;
-                border: none;
-            }
-            QPushButton:hover {
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #1E88E5, stop: 1 #1565C0
-                );
-            }
-            QPushButton:pressed {
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #1565C0, stop: 1 #0D47A1
-                );
-                padding: 6px 9px 4px 11px;
-            }
-        """
-        
-        self.recalc_button.setStyleSheet(button_style)
-        export_button.setStyleSheet(button_style)
-        
-        # Добавляем иконки к кнопкам
-        self.recalc_button.setIcon(QIcon("icons/refresh.png"))  # Нужно добавить иконки
-        self.recalc_button.setIconSize(QSize(16, 16))
-        export_button.setIcon(QIcon("icons/export.png"))
-        export_button.setIconSize(QSize(16, 16))
-        
-        # Добавляем разделители
-        line = QFrame()
-        line.setFrameShape(QFrame.HLine)
-        line.setFrameShadow(QFrame.Sunken)
-        line.setStyleSheet("""
-            QFrame {
-                border: none;
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 1, y2: 0,
-                    stop: 0 #E0E0E0, stop: 0.5 #9E9E9E, stop: 1 #E0E0E0
-                );
-                height: 1px;
-            }
-        """)
-        
-        # Добавляем разделитель после верхней панели
-        header_layout.addWidget(line)
-        
-        top_layout.addWidget(date_label)
-        top_layout.addWidget(self.recalc_button)
-        top_layout.addWidget(export_button)
-        top_layout.addStretch()
-        
-        # Вторая строка верхней панели
-        bottom_row = QWidget()
-        bottom_layout = QHBoxLayout(bottom_row)
-        bottom_layout.setContentsMargins(0, 0, 0, 0)
-        
-        # Добавляем выбор месяца и поиск
-        month_label = QLabel("Месяц:")
-        month_label.setStyleSheet("font-size: 12px;")
-        
-        self.month_dropdown = QComboBox()
-        self.month_dropdown.setFixedWidth(200)
-        self.setup_month_dropdown()
-        
-        # Добавляем поиск
-        search_widget = self.add_search_widget()
-        
-        bottom_layout.addWidget(month_label)
-        bottom_layout.addWidget(self.month_dropdown)
-        bottom_layout.addSpacing(20)
-        bottom_layout.addWidget(search_widget)
-        bottom_layout.addStretch()
-        
-        # Добавляем строки в верхнюю панель
-        header_layout.addWidget(top_row)
-        header_layout.addWidget(bottom_row)
-        
-        # Создаем основной контейнер
-        main_container = QWidget()
-        main_layout = QVBoxLayout(main_container)
-        main_layout.setSpacing(10)
-        main_layout.setContentsMargins(10, 10, 10, 10)
-        
-        # Добавляем верхнюю панель
-        main_layout.addWidget(header_widget)
-        
-        # Создаем контейнер для таблицы и правой панели
-        content_container = QWidget()
-        content_layout = QHBoxLayout(content_container)
-        content_layout.setSpacing(10)
-        content_layout.setContentsMargins(0, 0, 0, 0)
-        
-        # Добавляем таблицу
-        table_container = QWidget()
-        table_layout = QVBoxLayout(table_container)
-        table_layout.setContentsMargins(0, 0, 0, 0)
-        
-        self.table = QTableWidget()
-        self.setup_table_style()
-        table_layout.addWidget(self.table)
-        
-        # Создаем правую панель
-        right_panel = QWidget()
-        right_layout = QVBoxLayout(right_panel)
-        right_layout.setSpacing(10)
-        right_layout.setContentsMargins(10, 10, 10, 10)
-        
-        # Добавляем статистику использования
-        self.stats_widget = QFrame()
-        self.stats_widget.setFixedWidth(250)
-        self.stats_widget.setFrameStyle(QFrame.Box | QFrame.Raised)
-        self.stats_layout = QVBoxLayout(self.stats_widget)
-        
-        # Добавляем месячную статистику
-        monthly_stats = self.add_monthly_stats()
-        monthly_stats.setStyleSheet("""
-            QWidget {
-                background-color: #F5F5F5;
-                border-radius: 5px;
-                padding: 5px;
-            }
-            QLabel {
-                font-size: 11px;
-            }
-        """)
-        
-        right_layout.addWidget(self.stats_widget)
-        right_layout.addWidget(monthly_stats)
-        
-        # Добавляем компоненты в content_layout
-        content_layout.addWidget(table_container, stretch=4)
-        content_layout.addWidget(right_panel)
-        
-        # Добавляем все в главный layout
-        main_layout.addWidget(content_container)
-        
-        # Устанавливаем главный контейнер
-        self.setCentralWidget(main_container)
-        
-        # Обновляем стиль статистики с градиентом
-        stats_style = """
-            QFrame {
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #FFFFFF, stop: 1 #F5F5F5
-                );
-                border: 1px solid #BDBDBD;
-                border-radius: 8px;
-            }
-            QLabel {
-                font-size: 11px;
-                background: transparent;
-            }
-            QLabel[header="true"] {
-                font-weight: bold;
-                color: #1976D2;
-            }
-        """
-        
-        self.stats_widget.setStyleSheet(stats_style)
-        
-        # Добавляем тени
-        self.add_shadow(self.stats_widget)
-        self.add_shadow(self.table)
-        
-        # Инициализируем таблицу
-        self.update_table(self.current_date)
-        self.update_repair_dates()
-
-    def setup_month_dropdown(self):
-        months = []
-        for year in range(self.current_date.year - 1, self.current_date.year + 1):
-            for month in range(1, 13):
-                if year == self.current_date.year and month > self.current_date.month:
-                    continue
-                month_str = f"{year}-{month:02d}"
-                month_name = f"{calendar.month_name[month]} {year}"
-                self.month_dropdown.addItem(month_name, month_str)
-        
-        current_month_idx = self.month_dropdown.findData(
-            f"{self.current_date.year}-{self.current_date.month:02d}"
-        )
-        self.month_dropdown.setCurrentIndex(current_month_idx)
-        self.month_dropdown.currentIndexChanged.connect(self.on_month_changed)
-
-    def on_month_changed(self):
-        selected_date = datetime.strptime(
-            self.month_dropdown.currentData(), 
-            '%Y-%m'
-        )
-        self.update_table(selected_date)
-
-    def update_table(self, selected_date):
-        try:
-            df = pd.read_excel(self.opoka_data_manager.excel_file)
-            df['Плавка_дата'] = pd.to_datetime(df['Плавка_дата'], format='%d.%m.%Y')
-            usage_history = self.opoka_data_manager.load_history()
-            
-            # Обновляем счетчики использований и последнее использование
-            for opoka_num in range(1, 12):
-                # Находим последнее использование опоки
-                last_use = None
-                for _, row in df.sort_values('Плавка_дата', ascending=False).iterrows():
-                    if any(pd.notna(row[col]) and int(row[col]) == opoka_num 
-                          for col in ['Сектор_A_опоки', 'Сектор_B_опоки', 
-                                    'Сектор_C_опоки', 'Сектор_D_опоки']):
-                        last_use = row['Плавка_дата']
-                        break
-                
-                # Обновляем дату последнего использования
-                usage_history[str(opoka_num)]["last_use"] = (
-                    last_use.strftime('%Y-%m-%d') if last_use else None
-                )
-                
-                # Остальной код подсчета использований
-                last_repair_date = usage_history[str(opoka_num)]["last_repair_date"]
-                if last_repair_date:
-                    last_repair_date = datetime.strptime(last_repair_date, '%Y-%m-%d')
-                    
-                    # Считаем использования после последнего ремонта
-                    current_uses = 0
-                    filtered_df = df[df['Плавка_дата'] > last_repair_date]
-                    
-                    for _, row in filtered_df.iterrows():
-                        day_uses = sum(1 for col in ['Сектор_A_опоки', 'Сектор_B_опоки', 
-                                                   'Сектор_C_опоки', 'Сектор_D_опоки']
-                                     if pd.notna(row[col]) and int(row[col]) == opoka_num)
-                        current_uses += day_uses
-                    
-                    usage_history[str(opoka_num)]["count"] = current_uses
-                    
-                    # Если достигнут лимит использований, отправляем в ремонт
-                    if current_uses >= 100:
-                        self.send_to_repair(opoka_num)
-            
-            self.opoka_data_manager.save_history(usage_history)
-            
-            # Обновляем таблицу
-            self.table.clear()
-            
-            # Настраиваем таблицу
-            self.table.setRowCount(11)  # для опок 1-11
-            self.table.setColumnCount(32)  # номер опоки + 31 день
-            
-            # Устанавливаем заголовки
-            headers = ['Опока'] + [str(i) for i in range(1, 32)]
-            self.table.setHorizontalHeaderLabels(headers)
-            
-            # Настраиваем ширину колонок
-            self.table.horizontalHeader().setDefaultSectionSize(28)
-            self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
-            self.table.horizontalHeader().resizeSection(0, 45)
-            
-            # Заполняем данные
-            for opoka_num in range(1, 12):
-                # Номер опоки
-                self.table.setItem(opoka_num-1, 0, 
-                                 QTableWidgetItem(f"№{opoka_num}"))
-                
-                # Данные по дням
-                for day in range(1, 32):
-                    day_data = df[
-                        (df['Плавка_дата'].dt.day == day) &
-                        (df['Плавка_дата'].dt.month == selected_date.month) &
-                        (df['Плавка_дата'].dt.year == selected_date.year)
-                    ]
-                    
-                    count = 0
-                    for col in ['Сектор_A_опоки', 'Сектор_B_опоки', 
-                               'Сектор_C_опоки', 'Сектор_D_опоки']:
-                        count += len(day_data[day_data[col] == opoka_num])
-                    
-                    item = QTableWidgetItem(str(count) if count > 0 else "")
-                    if count > 3:  # Высокая нагрузка в день
-                        item.setBackground(QColor("#FFE0B2"))  # Оранжевый
-                    elif count > 0:
-                        item.setBackground(QColor("#C8E6C9"))  # Зеленый
-                    self.table.setItem(opoka_num-1, day, item)
-            
-            # Обновляем статистику
-            self.update_statistics()
-            
-        except Exception as e:
-            self.status_label.setText(f"Ошибка: {str(e)}")
-            self.status_label.setStyleSheet("color: red;")
-
-    def get_row_color(self, opoka_data):
-        """Определяет цвет фона строки на основе текущего количества использований"""
-        count = int(opoka_data["count"])
-        
-        if opoka_data.get("in_repair"):
-            return "#BDBDBD"  # Серый для ремонта
-        elif opoka_data.get("auto_reset"):
-            return "#E3F2FD"  # Голубой для простоя
-        elif count >= 91:
-            return "#FFCDD2"  # Красный для 91-100
-        elif count >= 80:
-            return "#FFF9C4"  # Желтый для 80-90
-        return "#FFFFFF"  # Белый для остальных случаев
-
-    def update_statistics(self):
-        # Очищаем текущую статистику
-        for i in reversed(range(self.stats_layout.count())): 
-            self.stats_layout.itemAt(i).widget().deleteLater()
-        
-        # Добавляем заголовок
-        header = QLabel("Статистика использования:")
-        header.setStyleSheet("font-weight: bold; font-size: 11px;")
-        self.stats_layout.addWidget(header)
-        
-        # Создаем заголовок таблицы статистики
-        header_widget = QWidget()
-        header_layout = QHBoxLayout(header_widget)
-        header_layout.setSpacing(2)
-        
-        headers = ["№", "Тек.", "Всего", "Рем.", "Статус"]
-        widths = [25, 35, 40, 35, 50]
-        
-        for header_text, width in zip(headers, widths):
-            label = QLabel(header_text)
-            label.setFixedWidth(width)
-            label.setStyleSheet("font-size: 11px;")
-            header_layout.addWidget(label)
-        
-        header_widget.setStyleSheet("background-color: #CFD8DC; border-radius: 3px;")
-        self.stats_layout.addWidget(header_widget)
-        
-        # Добавляем данные статистики
-        usage_history = self.opoka_data_manager.load_history()
-        
-        for i in range(1, 12):
-            opoka_data = usage_history[str(i)]
-            
-            row_widget = QWidget()
-            row_layout = QHBoxLayout(row_widget)
-            row_layout.setSpacing(2)
-            
-            # Добавляем данные
-            data = [
-                str(i),
-                str(opoka_data["count"]),
-                str(opoka_data["total_count"]),
-                str(opoka_data["repair_count"]),
-                self.get_status_text(opoka_data)
-            ]
-            
-            # Определяем цвет текста для значения count
-            count_color = "red" if int(opoka_data["count"]) >= 91 else "black"
-            
-            for idx, (text, width) in enumerate(zip(data, widths)):
-                label = QLabel(text)
-                label.setFixedWidth(width)
-                # Применяем красный цвет только к полю "Тек." если count >= 91
-                if idx == 1 and count_color == "red":
-                    label.setStyleSheet("font-size: 11px; color: red; font-weight: bold;")
-                else:
-                    label.setStyleSheet("font-size: 11px;")
-                row_layout.addWidget(label)
-            
-            # Добавляем кнопку ремонта
-            repair_button = QPushButton()
-            repair_button.setFixedSize(QSize(30, 30))
-            repair_button.clicked.connect(
-                lambda checked, num=i: self.toggle_repair(num)
-            )
-            repair_button.setText("🔧" if not opoka_data["in_repair"] else "↩")
-            row_layout.addWidget(repair_button)
-            
-            # Устанавливаем цвет фона строки
-            bg_color = self.get_row_color(opoka_data)
-            row_widget.setStyleSheet(f"""
-                background-color: {bg_color}; 
-                border-radius: 3px;
-                margin: 1px;
-                padding: 2px;
-            """)
-            
-            # Создаем детальную подсказку
-            tooltip_text = (
-                f"Опока №{i}\n"
-                f"Текущих использований: {opoka_data['count']}\n"
-                f"Всего использований: {opoka_data['total_count']}\n"
-                f"Количество ремонтов: {opoka_data['repair_count']}\n"
-                f"Последний ремонт: {opoka_data['last_repair_date'] or 'Не было'}\n"
-                f"Последнее использование: {opoka_data['last_use'] or 'Не использовалась'}"
-            )
-            
-            row_widget.setToolTip(tooltip_text)
-            
-            # Добавляем анимацию при наведении на строку статистики
-            self.add_hover_animation(row_widget)
-            
-            # Обновляем стиль кнопки ремонта
-            repair_button.setStyleSheet("""
-                QPushButton {
-                    background: qlineargradient(
-                        x1: 0, y1: 0, x2: 0, y2: 1,
-                        stop: 0 #F5F5F5, stop: 1 #E0E0E0
-                    );
-                    border: 1px solid #BDBDBD;
-                    border-radius: 4px;
-                }
-                QPushButton:hover {
-                    background: qlineargradient(
-                        x1: 0, y1: 0, x2: 0, y2: 1,
-                        stop: 0 #E0E0E0, stop: 1 #BDBDBD
-                    );
-                }
-                QPushButton:pressed {
-                    padding: 2px -2px -2px 2px;
-                }
-            """)
-            
-            self.stats_layout.addWidget(row_widget)
-
-    def get_status_text(self, opoka_data):
-        if opoka_data.get("in_repair"):
-            return "В ремонте"
-        elif opoka_data.get("auto_reset"):
-            return f"Простой ({opoka_data.get('unused_days', 0)} дней)"
-        return "Готова"
-
-    def get_status_color(self, opoka_data):
-        if opoka_data.get("in_repair"):
-            return "#BDBDBD"  # Серый
-        elif opoka_data.get("auto_reset"):
-            return "#E3F2FD"  # Голубой
-        elif opoka_data["count"] >= 100:
-            return "#FFCDD2"  # Красный
-        return "#C8E6C9"  # Зеленый
-
-    def toggle_repair(self, opoka_num):
-        usage_history = self.opoka_data_manager.load_history()
-        if usage_history[str(opoka_num)]["in_repair"]:
-            self.return_from_repair(opoka_num)
-        else:
-            self.send_to_repair(opoka_num)
-
-    def send_to_repair(self, opoka_num):
-        reply = QMessageBox.question(
-            self,
-            'Подтверждение',
-            f'Отправить опоку №{opoka_num} в ремонт?',
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No
-        )
-        
-        if reply == QMessageBox.Yes:
-            usage_history = self.opoka_data_manager.load_history()
-            usage_history[str(opoka_num)]["repair_count"] += 1
-            usage_history[str(opoka_num)]["count"] = 0  # Сбрасываем текущий счетчик
-            usage_history[str(opoka_num)]["in_repair"] = True
-            usage_history[str(opoka_num)]["last_use"] = None
-            usage_history[str(opoka_num)]["last_repair_date"] = datetime.now().strftime('%Y-%m-%d')
-            self.opoka_data_manager.save_history(usage_history)
-            self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
-
-    def return_from_repair(self, opoka_num):
-        usage_history = self.opoka_data_manager.load_history()
-        usage_history[str(opoka_num)]["in_repair"] = False
-        usage_history[str(opoka_num)]["count"] = 0  # Сбрасываем счетчик после ремонта
-        self.opoka_data_manager.save_history(usage_history)
-        self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
-
-    def recalculate_and_update(self):
-        self.recalculate_history()
-        self.update_table(self.current_date)
-
-    def update_repair_dates(self):
-        usage_history = self.opoka_data_manager.load_history()
-        
-        # 28.01.2025 - опоки 2 и 5
-        for opoka in ['2', '5']:
-            usage_history[opoka].update({
-                "last_repair_date": "2025-01-28",
-                "in_repair": False,
-                "auto_reset": False
-            })
-        
-        self.opoka_data_manager.save_history(usage_history)
-
-    def recalculate_history(self):
-        try:
-            df = pd.read_excel(self.opoka_data_manager.excel_file)
-            df['Плавка_дата'] = pd.to_datetime(df['Плавка_дата'], format='%d.%m.%Y')
-            df = df.sort_values('Плавка_дата')
-            
-            history = {str(i): {
-                "count": 0,
-                "total_count": 0,
-                "repair_count": 0,
-                "last_use": None,
-                "last_repair_date": None,
-                "in_repair": False
-            } for i in range(1, 12)}
-            
-            # Для каждой опоки
-            for opoka_num in range(1, 12):
-                total_uses = 0
-                current_count = 0
-                repair_dates = []
-                last_use_date = None
-                
-                # Проходим по всем записям
-                for _, row in df.iterrows():
-                    date = row['Плавка_дата']
-                    if date > pd.Timestamp('2025-02-01'):
-                        continue
-                    
-                    # Считаем использования в этот день
-                    day_uses = sum(1 for col in ['Сектор_A_опоки', 'Сектор_B_опоки', 
-                                               'Сектор_C_опоки', 'Сектор_D_опоки']
-                                 if pd.notna(row[col]) and int(row[col]) == opoka_num)
-                    
-                    if day_uses > 0:
-                        total_uses += day_uses
-                        current_count += day_uses
-                        last_use_date = date
-                        
-                        # Проверяем необходимость ремонта
-                        if current_count >= 100:
-                            repair_dates.append(date.strftime('%Y-%m-%d'))
-                            current_count = 0
-                
-                # Устанавливаем значения
-                history[str(opoka_num)].update({
-                    "total_count": total_uses,
-                    "repair_count": len(repair_dates),
-                    "count": current_count,
-                    "last_use": last_use_date.strftime('%Y-%m-%d') if last_use_date else None,
-                    "last_repair_date": repair_dates[-1] if repair_dates else None
-                })
-            
-            return history
-            
-        except Exception as e:
-            print(f"Ошибка при пересчете истории: {str(e)}")
-            return None
-
-    def export_statistics(self):
-        try:
-            usage_history = self.opoka_data_manager.load_history()
-            export_data = []
-            
-            for i in range(1, 12):
-                opoka_data = usage_history[str(i)]
-                export_data.append({
-                    'Номер опоки': i,
-                    'Текущие использования': opoka_data['count'],
-                    'Всего использований': opoka_data['total_count'],
-                    'Количество ремонтов': opoka_data['repair_count'],
-                    'Последний ремонт': opoka_data['last_repair_date'],
-                    'Последнее использование': opoka_data['last_use'],
-                    'Статус': self.get_status_text(opoka_data)
-                })
-            
-            df = pd.DataFrame(export_data)
-            df.to_excel('статистика_опок.xlsx', index=False)
-            
-            QMessageBox.information(
-                self,
-                'Успех',
-                'Статистика успешно экспортирована в файл "статистика_опок.xlsx"'
-            )
-        except Exception as e:
-            QMessageBox.critical(
-                self,
-                'Ошибка',
-                f'Не удалось экспортировать статистику: {str(e)}'
-            )
-
-    def add_search_widget(self):
-        search_widget = QWidget()
-        search_layout = QHBoxLayout(search_widget)
-        search_layout.setContentsMargins(0, 0, 0, 0)
-        
-        search_label = QLabel("Поиск опоки:")
-        search_label.setStyleSheet("font-size: 12px;")
-        
-        self.search_input = QLineEdit()
-        self.search_input.setPlaceholderText("Введите номер опоки...")
-        self.search_input.setFixedWidth(150)
-        self.search_input.textChanged.connect(self.filter_table)
-        
-        search_layout.addWidget(search_label)
-        search_layout.addWidget(self.search_input)
-        
-        # Стиль для комбобокса и поля поиска
-        input_style = """
-            QComboBox, QLineEdit {
-                border: 1px solid #BDBDBD;
-                border-radius: 4px;
-                padding: 3px;
-                background-color: white;
-                font-size: 11px;
-            }
-            QComboBox:hover, QLineEdit:hover {
-                border: 1px solid #2196F3;
-            }
-            QComboBox::drop-down {
-                border: none;
-                padding-right: 5px;
-            }
-            QComboBox::down-arrow {
-                image: url(down_arrow.png);
-                width: 12px;
-                height: 12px;
-            }
-        """
-        
-        self.month_dropdown.setStyleSheet(input_style)
-        self.search_input.setStyleSheet(input_style)
-        
-        return search_widget
-
-    def filter_table(self, text):
-        if not text:
-            # Показать все строки
-            for row in range(self.table.rowCount()):
-                self.table.showRow(row)
-        else:
-            # Скрыть строки, которые не соответствуют поиску
-            for row in range(self.table.rowCount()):
-                item = self.table.item(row, 0)
-                if item and text in item.text():
-                    self.table.showRow(row)
-                else:
-                    self.table.hideRow(row)
-
-    def add_monthly_stats(self):
-        monthly_stats = QWidget()
-        layout = QVBoxLayout(monthly_stats)
-        
-        # Добавляем заголовок
-        header = QLabel("Месячная статистика")
-        header.setStyleSheet("""
-            font-weight: bold;
-            font-size: 11px;
-            color: #1976D2;
-            padding-bottom: 5px;
-        """)
-        layout.addWidget(header)
-        
-        current_month = self.month_dropdown.currentData()
-        usage_history = self.opoka_data_manager.load_history()
-        
-        total_uses = sum(int(data["count"]) for data in usage_history.values())
-        repairs_this_month = sum(
-            1 for data in usage_history.values() 
-            if data["last_repair_date"] 
-            and data["last_repair_date"].startswith(current_month)
-        )
-        
-        stats_text = (
-            f"Статистика за {self.month_dropdown.currentText()}:\n"
-            f"Всего использований: {total_uses}\n"
-            f"Ремонтов за месяц: {repairs_this_month}"
-        )
-        
-        label = QLabel(stats_text)
-        layout.addWidget(label)
-        
-        # Улучшаем стиль текста статистики
-        label.setStyleSheet("""
-            background-color: white;
-            padding: 8px;
-            border-radius: 4px;
-            font-size: 11px;
-            line-height: 1.4;
-        """)
-        
-        return monthly_stats
-
-    def setup_table_style(self):
-        self.table.setStyleSheet("""
-            QTableWidget {
-                border: 1px solid #BDBDBD;
-                border-radius: 8px;
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #FFFFFF, stop: 1 #F5F5F5
-                );
-            }
-            QTableWidget::item {
-                padding: 2px;
-                font-size: 11px;
-            }
-            QTableWidget::item:hover {
-                background: rgba(33, 150, 243, 0.1);
-            }
-            QHeaderView::section {
-                background: qlineargradient(
-                    x1: 0, y1: 0, x2: 0, y2: 1,
-                    stop: 0 #F5F5F5, stop: 1 #E0E0E0
-                );
-                padding: 2px;
-                font-size: 11px;
-                border: 1px solid #BDBDBD;
-            }
-        """)
-
-    def add_shadow(self, widget):
-        shadow = QGraphicsDropShadowEffect()
-        shadow.setBlurRadius(10)
-        shadow.setColor(QColor(0, 0, 0, 50))
-        shadow.setOffset(0, 2)
-        widget.setGraphicsEffect(shadow)
-
-    def add_hover_animation(self, widget):
-        """Добавляет анимацию при наведении"""
-        animation = QPropertyAnimation(widget, b"geometry")
-        animation.setDuration(100)
-        animation.setEasingCurve(QEasingCurve.OutCubic)
-        
-        def on_hover_enter():
-            geometry = widget.geometry()
-            animation.setStartValue(geometry)
-            animation.setEndValue(geometry.adjusted(-2, -2, 2, 2))
-            animation.start()
-        
-        def on_hover_leave():
-            geometry = widget.geometry()
-            animation.setStartValue(geometry)
-            animation.setEndValue(geometry.adjusted(2, 2, -2, -2))
-            animation.start()
-        
-        widget.enterEvent = lambda e: on_hover_enter()
-        widget.leaveEvent = lambda e: on_hover_leave()
+import opoka_timing as timing
+from opoka_records import FleetConfig, status_dict, status_text
 
-if __name__ == '__main__':
-    app = QApplication(sys.argv)
+HEAVY_MODULES = ('PySide6', 'pandas', 'openpyxl', 'pyarrow')
+
+
+def run_gui(args):
+    from PySide6.QtWidgets import QApplication
+    from opoka_gui import APP_STYLESHEET, MainWindow
+
+    app = QApplication(sys.argv[:1])
+    # Таблица стилей разбирается один раз для всего приложения
+    app.setStyleSheet(APP_STYLESHEET)
     window = MainWindow()
+    if args.timing or args.startup_report:
+        window.first_painted.connect(lambda: report_first_paint(args, app, window))
     window.show()
-    sys.exit(app.exec()) 
\ No newline at end of file
+    return app.exec()
+
+
+def report_first_paint(args, app, window):
+    """Время от запуска до первой отрисовки окна. С --startup-report результат
+    записывается в файл JSON и программа завершается (для benchmark.py startup)"""
+    first_paint_ms = (time.perf_counter() - START_TIME) * 1000
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    if args.timing:
+        timing.write({"span": "startup/first_paint", "ms": round(first_paint_ms, 2)})
+        print(f"Первая отрисовка окна: {first_paint_ms:.0f} мс, "
+              f"загружены: {', '.join(heavy)}", file=sys.stderr)
+    if args.startup_report:
+        from PySide6.QtCore import QTimer
+
+        with open(args.startup_report, 'w', encoding='utf-8') as f:
+            json.dump({
+                "first_paint_ms": first_paint_ms,
+                "first_paint_time": time.time(),
+                "modules": heavy
+            }, f)
+        # Замер заканчивается на первой отрисовке: журнал не загружаем и
+        # выходим после того, как кадр попадет на экран
+        window.initial_load_timer.stop()
+        QTimer.singleShot(0, app.quit)
+
+
+def open_data_manager(args):
+    from opoka_data import create_data_manager
+
+    fleet = FleetConfig.load(args.fleet_config)
+    return create_data_manager(args.backend, fleet)
+
+
+def report_quarantine(data_manager):
+    """Сообщает о ячейках журнала плавок, которые не удалось разобрать"""
+    if data_manager.quarantine:
+        print(f"Ячеек журнала плавок с ошибками: {len(data_manager.quarantine)}, "
+              f"они не учтены (отчет: {data_manager.quarantine_file})", file=sys.stderr)
+
+
+def report_repair_errors(data_manager):
+    """Сообщает о поврежденных строках журнала ремонтов"""
+    journal = data_manager.repair_journal
+    for position, error in journal.skipped:
+        print(f"Журнал ремонтов {journal.path}: строка с позиции {position} пропущена: {error}",
+              file=sys.stderr)
+
+
+def run_recalc(args):
+    """Пересчитывает состояние опок по всему журналу ремонтов и журналу плавок,
+    как кнопка "Пересчитать" в окне. Опоки, достигшие лимита, только
+    перечисляются: отправка в ремонт требует подтверждения"""
+    from opoka_data import HistoryStore, apply_usage_stats, collect_repair_dates
+
+    data_manager = open_data_manager(args)
+    fleet = data_manager.fleet
+    history_store = HistoryStore(data_manager)
+
+    data_manager.migrate_repairs(history_store.get())
+    with timing.span('replay'):
+        data_manager.repair_journal.rebuild()
+    repairs = data_manager.load_repairs()
+    report_repair_errors(data_manager)
+    repair_dates = collect_repair_dates(repairs, fleet.opoka_nums)
+    with timing.span('load'):
+        data_manager.load_plavka()
+    report_quarantine(data_manager)
+    with timing.span('usage_stats'):
+        usage_stats = data_manager.usage_stats(fleet.opoka_nums, repair_dates)
+    over_limit = apply_usage_stats(history_store, usage_stats, repairs,
+                                   fleet.opoka_nums, fleet.repair_limit)
+    changed = sorted(history_store.dirty)
+    history_store.flush()
+
+    print(f"Обновлено опок: {len(changed)}")
+    if over_limit:
+        print("Достигли лимита использований: " + ", ".join(f"№{i}" for i in over_limit))
+    return 0
+
+
+def run_repair(args):
+    """Записывает событие в журнал ремонтов или выводит журнал (log).
+
+    Счетчики в истории сразу отражают событие; использования после даты
+    события досчитываются при следующем пересчете (recalc или окно).
+    """
+    from opoka_data import HistoryStore, record_repair
+    from opoka_journal import CORRECTION, REPAIR_OUT, REPAIR_RETURN
+
+    data_manager = open_data_manager(args)
+    history_store = HistoryStore(data_manager)
+    data_manager.migrate_repairs(history_store.get())
+
+    if args.action == 'log':
+        data_manager.load_repairs()
+        report_repair_errors(data_manager)
+        for event in data_manager.repair_journal.events():
+            if args.opoka is not None and event['opoka'] != args.opoka:
+                continue
+            details = ", ".join(f"{key}={event[key]}" for key in
+                                ('count', 'repair_count', 'last_repair_date', 'in_repair', 'note')
+                                if key in event)
+            print(f"{event['seq']:>5}  {event['date']}  №{event['opoka']:<3} "
+                  f"{event['kind']:<13} {details}".rstrip())
+        return 0
+
+    if args.opoka not in data_manager.fleet.opoka_nums:
+        print(f"Ошибка: укажите номер опоки парка (сейчас: {args.opoka})", file=sys.stderr)
+        return 2
+
+    fields = {}
+    if args.action == 'correct':
+        for name in ('count', 'repair_count', 'last_repair_date'):
+            value = getattr(args, name)
+            if value is not None:
+                fields[name] = str(value) if name == 'last_repair_date' else value
+        if not fields:
+            print("Ошибка: для поправки укажите --count, --repair-count или "
+                  "--last-repair-date", file=sys.stderr)
+            return 2
+    if args.note:
+        fields['note'] = args.note
+
+    kind = {'out': REPAIR_OUT, 'return': REPAIR_RETURN, 'correct': CORRECTION}[args.action]
+    record_repair(data_manager, history_store, kind, args.opoka, str(args.date), **fields)
+    history_store.flush()
+    print(f"Опока №{args.opoka}: {status_text(history_store.get()[args.opoka])}")
+    return 0
+
+
+def run_export(args):
+    from opoka_data import DataCache
+    from opoka_export import TABLES, export_table
+
+    data_manager = open_data_manager(args)
+    try:
+        with timing.span('export'):
+            written = export_table(args.output, args.table, DataCache(data_manager),
+                                   data_manager.load_history(), args.date_from, args.date_to,
+                                   args.chunk_rows)
+    except ValueError as e:
+        print(f"Ошибка экспорта: {e}", file=sys.stderr)
+        return 2
+
+    print(f"Таблица \"{TABLES[args.table]}\" ({written} строк) выгружена в файл \"{args.output}\"")
+    return 0
+
+
+def run_status(args):
+    data_manager = open_data_manager(args)
+    fleet = data_manager.fleet
+    history = data_manager.load_history()
+    if args.as_of:
+        # Состояние на дату для сверки: счетчики по журналу плавок с учетом
+        # ремонтов и поправок, записанных к этой дате
+        data_manager.load_plavka()
+        report_quarantine(data_manager)
+        history = data_manager.state_as_of(args.as_of, fleet.opoka_nums)
+
+    if args.json:
+        status = [status_dict(i, history[i], fleet) for i in fleet.opoka_nums]
+        json.dump(status, sys.stdout, ensure_ascii=False, indent=4)
+        print()
+        return 0
+
+    print(f"{'№':>3} {'Тек.':>5} {'Всего':>6} {'Рем.':>4}  Статус")
+    for i in fleet.opoka_nums:
+        record = history[i]
+        print(f"{i:>3} {record.count:>5} {record.total_count:>6} "
+              f"{record.repair_count:>4}  {status_text(record)}")
+    return 0
+
+
+def run_serve(args):
+    from opoka_api import OpokaApi, create_server
+    from opoka_data import DataCache, HistoryStore
+
+    data_manager = open_data_manager(args)
+    api = OpokaApi(DataCache(data_manager), HistoryStore(data_manager), data_manager.fleet)
+    server = create_server(api, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"API опок: http://{host}:{port}/api/flasks")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Учет использования опок")
+    parser.add_argument('--backend', choices=['json', 'sqlite'],
+                        help="хранилище истории (по умолчанию OPOKA_BACKEND или json)")
+    parser.add_argument('--fleet-config', default='fleet_config.json',
+                        help="файл конфигурации парка опок")
+    parser.add_argument('--timing', action='store_true',
+                        help="вывести время запуска и этапов команды в stderr и записывать "
+                             "замеры в opoka_timing.jsonl (то же, что OPOKA_TIMING=1)")
+    parser.add_argument('--startup-report', metavar='FILE',
+                        help="записать время до первой отрисовки окна в FILE (JSON) "
+                             "и завершить программу")
+    parser.set_defaults(handler=run_gui)
+
+    commands = parser.add_subparsers(dest='command')
+
+    recalc = commands.add_parser('recalc', help="пересчитать счетчики по журналу плавок")
+    recalc.set_defaults(handler=run_recalc)
+
+    export = commands.add_parser('export', help="выгрузить статистику опок")
+    export.add_argument('-o', '--output', default='статистика_опок.xlsx',
+                        help="файл выгрузки: .xlsx, .csv или .parquet")
+    export.add_argument('--table', choices=['statistics', 'usages', 'repairs'],
+                        default='statistics',
+                        help="сводка по опокам, использования по плавкам или ремонты")
+    export.add_argument('--from', dest='date_from', metavar='ГГГГ-ММ-ДД',
+                        type=date.fromisoformat, help="начало периода (включительно)")
+    export.add_argument('--to', dest='date_to', metavar='ГГГГ-ММ-ДД',
+                        type=date.fromisoformat, help="конец периода (включительно)")
+    export.add_argument('--chunk-rows', type=int, default=50000,
+                        help="плавок в одной части при записи")
+    export.set_defaults(handler=run_export)
+
+    status = commands.add_parser('status', help="показать состояние опок")
+    status.add_argument('--json', action='store_true', help="вывод в формате JSON")
+    status.add_argument('--as-of', metavar='ГГГГ-ММ-ДД', type=date.fromisoformat,
+                        help="состояние на конец указанного дня по журналу плавок")
+    status.set_defaults(handler=run_status)
+
+    repair = commands.add_parser('repair', help="журнал ремонтов опок")
+    repair.add_argument('action', choices=['out', 'return', 'correct', 'log'],
+                        help="отправка в ремонт, возврат из ремонта, ручная поправка "
+                             "или вывод журнала")
+    repair.add_argument('opoka', type=int, nargs='?', help="номер опоки")
+    repair.add_argument('--date', type=date.fromisoformat, default=date.today(),
+                        metavar='ГГГГ-ММ-ДД', help="дата события (по умолчанию сегодня)")
+    repair.add_argument('--count', type=int,
+                        help="поправка: счетчик использований на конец даты события")
+    repair.add_argument('--repair-count', type=int, help="поправка: количество ремонтов")
+    repair.add_argument('--last-repair-date', type=date.fromisoformat, metavar='ГГГГ-ММ-ДД',
+                        help="поправка: ремонт, не записанный в журнал")
+    repair.add_argument('--note', help="комментарий к событию")
+    repair.set_defaults(handler=run_repair)
+
+    serve = commands.add_parser('serve', help="локальный HTTP API только для чтения")
+    serve.add_argument('--host', default='127.0.0.1', help="адрес (по умолчанию только localhost)")
+    serve.add_argument('--port', type=int, default=8765, help="порт")
+    serve.set_defaults(handler=run_serve)
+
+    return parser
+
+
+def report_timing(ready_time, trace):
+    """Печатает время холодного запуска (до начала команды), выполнения команды
+    и ее этапов"""
+    finish_time = time.perf_counter()
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(
+        f"Запуск: {(ready_time - START_TIME) * 1000:.0f} мс, "
+        f"команда: {(finish_time - ready_time) * 1000:.0f} мс, "
+        f"загружены: {', '.join(heavy) or 'нет тяжелых модулей'}",
+        file=sys.stderr
+    )
+    if trace.spans:
+        print(f"Этапы: {trace.summary()}", file=sys.stderr)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    ready_time = time.perf_counter()
+    if not args.timing:
+        return args.handler(args)
+
+    timing.enable()
+    if args.handler is run_gui:
+        # Окно собирает замеры каждого обновления само
+        return args.handler(args)
+
+    trace = timing.Trace(args.command)
+    error = None
+    try:
+        with timing.activate(trace):
+            return args.handler(args)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        trace.finish(error)
+        report_timing(ready_time, trace)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
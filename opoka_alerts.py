@@ -0,0 +1,85 @@
+"""Оповещения о переходе счетчиков опок через пороги.
+
+Пороги - предупреждение, критический износ и лимит до ремонта из FleetConfig.
+Каждый порог срабатывает один раз за цикл между ремонтами. Модуль не зависит
+от pandas и Qt.
+"""
+import json
+import os
+from collections import namedtuple
+
+ThresholdAlert = namedtuple('ThresholdAlert', ['opoka', 'threshold', 'count'])
+
+
+def threshold_text(threshold, fleet):
+    if threshold >= fleet.repair_limit:
+        return "достигнут лимит, нужен ремонт"
+    elif threshold >= fleet.critical_threshold:
+        return "критический износ"
+    return "приближается к лимиту"
+
+
+def alert_text(alert, fleet):
+    return f"Опока №{alert.opoka}: {alert.count} исп., {threshold_text(alert.threshold, fleet)}"
+
+
+class ThresholdMonitor:
+    """Находит опоки, счетчик которых перешел через очередной порог.
+
+    Проверяются только опоки, у которых с прошлого вызова изменились счетчик
+    или ремонт. Порог срабатывает один раз, пока опоку не отремонтировали или
+    счетчик не опустился ниже него (поправка); если счетчик перешел сразу
+    несколько порогов, оповещение одно - о старшем. Сработавшие пороги
+    сохраняются в path, поэтому после перезапуска оповещения не повторяются.
+    """
+
+    def __init__(self, fleet, path='opoka_thresholds.json'):
+        self.thresholds = sorted({fleet.warning_threshold, fleet.critical_threshold,
+                                  fleet.repair_limit})
+        self.path = path
+        self.seen = {}  # Номер опоки -> (счетчик, последний ремонт, в ремонте)
+        self.fired = None  # Номер опоки -> {"cycle": последний ремонт, "threshold": порог}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.fired = {int(key): value for key, value in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            self.fired = {}
+
+    def save(self):
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({str(key): value for key, value in sorted(self.fired.items())}, f, indent=4)
+        os.replace(tmp_file, self.path)
+
+    def process(self, history, opoka_nums):
+        """Возвращает новые оповещения [ThresholdAlert] по записям опок history"""
+        if self.fired is None:
+            self.load()
+
+        alerts = []
+        changed = False
+        for opoka_num in opoka_nums:
+            record = history[opoka_num]
+            key = (record.count, record.last_repair_date, bool(record.in_repair))
+            if self.seen.get(opoka_num) == key:
+                continue
+            self.seen[opoka_num] = key
+
+            state = self.fired.get(opoka_num)
+            fired = state["threshold"] if state and state["cycle"] == record.last_repair_date else 0
+            reached = 0
+            if not record.in_repair:
+                reached = max((t for t in self.thresholds if record.count >= t), default=0)
+            if reached > fired:
+                alerts.append(ThresholdAlert(opoka_num, reached, record.count))
+
+            new_state = {"cycle": record.last_repair_date, "threshold": reached}
+            if state != new_state:
+                self.fired[opoka_num] = new_state
+                changed = True
+
+        if changed:
+            self.save()
+        return alerts
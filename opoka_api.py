@@ -0,0 +1,172 @@
+"""Локальный HTTP API только для чтения: состояние опок, таблицы месяцев и ремонты.
+
+    GET /api/flasks              - состояние всех опок
+    GET /api/flasks/<номер>      - состояние одной опоки
+    GET /api/months              - месяцы, за которые есть плавки
+    GET /api/months/<ГГГГ-ММ>    - использования опок по дням месяца
+    GET /api/repairs[?opoka=N]   - история ремонтов
+
+Ответы строятся из тех же объектов в памяти, что и у окна (DataCache,
+HistoryStore). Каждый ответ получает ETag по версии данных, от которых он
+зависит; на запрос с совпадающим If-None-Match отдается 304 без тела, так что
+частый опрос стоит проверки времени изменения файлов.
+"""
+import calendar
+import json
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from opoka_records import status_dict
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class OpokaApi:
+    """Обработка запросов API без привязки к HTTP-серверу.
+
+    reload_history - перечитывать историю, если файл изменили извне. Окно
+    делает это само, поэтому при запуске из окна флаг выключается.
+    """
+
+    def __init__(self, data_cache, history_store, fleet, reload_history=True):
+        self.data_cache = data_cache
+        self.history_store = history_store
+        self.fleet = fleet
+        self.reload_history = reload_history
+        # Версии DataCache и HistoryStore начинаются заново при каждом запуске,
+        # поэтому в ETag добавляется метка запуска
+        self.instance = secrets.token_hex(4)
+        self.lock = threading.Lock()
+
+    def handle(self, path, if_none_match=None):
+        """Возвращает (код ответа, ETag, тело в виде bytes)"""
+        url = urlsplit(path)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+
+        try:
+            with self.lock:
+                if parts[:1] != ['api'] or len(parts) < 2:
+                    raise ApiError(404, "Неизвестный адрес")
+                etag, build = self.route(parts[1:], query)
+                if if_none_match is not None and etag in if_none_match:
+                    return 304, etag, b''
+                body = build()
+        except ApiError as e:
+            return e.status, None, self.encode({"error": str(e)})
+        return 200, etag, self.encode(body)
+
+    def route(self, parts, query):
+        """Возвращает ETag ответа и функцию, строящую тело ответа"""
+        resource, args = parts[0], parts[1:]
+        if resource == 'flasks' and len(args) <= 1:
+            return self.history_etag(), lambda: self.flasks(args)
+        if resource == 'repairs' and not args:
+            return self.history_etag(), lambda: self.repairs(query)
+        if resource == 'months' and not args:
+            return self.data_etag(), self.months
+        if resource == 'months' and len(args) == 1:
+            year, month = self.parse_month(args[0])
+            return self.data_etag(), lambda: self.month_grid(year, month)
+        raise ApiError(404, "Неизвестный адрес")
+
+    def history_etag(self):
+        if self.reload_history:
+            self.history_store.reload_if_changed()
+        self.history_store.get()
+        return f'"{self.instance}-h{self.history_store.version}"'
+
+    def data_etag(self):
+        # load() перечитывает журнал, только если файл изменился
+        return f'"{self.instance}-d{self.data_cache.load()}"'
+
+    def flasks(self, args):
+        history = self.history_store.get()
+        if not args:
+            return [status_dict(i, history[i], self.fleet) for i in self.fleet.opoka_nums]
+
+        opoka_num = self.parse_opoka(args[0])
+        if opoka_num not in history:
+            raise ApiError(404, f"Опока №{opoka_num} не найдена")
+        return status_dict(opoka_num, history[opoka_num], self.fleet)
+
+    def repairs(self, query):
+        events = self.data_cache.data_manager.repair_history(self.history_store.get())
+        if 'opoka' in query:
+            opoka_num = self.parse_opoka(query['opoka'][0])
+            events = [event for event in events if event[0] == opoka_num]
+        return [{"opoka": opoka, "date": date, "kind": kind} for opoka, date, kind in events]
+
+    def months(self):
+        return [f"{year}-{month:02d}" for year, month in self.data_cache.months()]
+
+    def month_grid(self, year, month):
+        grid = self.data_cache.month_grid(year, month, self.fleet.opoka_nums, check_file=False)
+        return {
+            "month": f"{year}-{month:02d}",
+            "days": calendar.monthrange(year, month)[1],
+            "flasks": {str(i): row.tolist() for i, row in zip(self.fleet.opoka_nums, grid)}
+        }
+
+    @staticmethod
+    def parse_opoka(text):
+        try:
+            return int(text)
+        except ValueError:
+            raise ApiError(400, f"Неверный номер опоки: {text}")
+
+    @staticmethod
+    def parse_month(text):
+        try:
+            year, month = (int(part) for part in text.split('-'))
+        except ValueError:
+            raise ApiError(400, f"Месяц задается как ГГГГ-ММ: {text}")
+        if not 1 <= month <= 12:
+            raise ApiError(400, f"Месяц задается как ГГГГ-ММ: {text}")
+        return year, month
+
+    @staticmethod
+    def encode(body):
+        return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+def make_handler(api):
+    class ApiRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, etag, body = api.handle(self.path, self.headers.get('If-None-Match'))
+            self.send_response(status)
+            if etag is not None:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            if status != 304:
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Частый опрос не должен засорять вывод
+            pass
+
+    return ApiRequestHandler
+
+
+def create_server(api, host='127.0.0.1', port=8765):
+    """Создает HTTP-сервер API; запуск - serve_forever(), при port=0 порт
+    выбирается свободный (server.server_address)"""
+    return ThreadingHTTPServer((host, port), make_handler(api))
+
+
+def start_in_thread(api, host='127.0.0.1', port=8765):
+    """Запускает сервер API в фоновом потоке и возвращает его"""
+    server = create_server(api, host, port)
+    thread = threading.Thread(target=server.serve_forever, name='opoka-api', daemon=True)
+    thread.start()
+    return server
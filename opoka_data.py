@@ -0,0 +1,900 @@
+import atexit
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+
+from opoka_journal import CORRECTION, REPAIR_OUT, REPAIR_RETURN, FlaskRepairs, RepairJournal
+from opoka_records import (DATE_COLUMN, EMPTY_DAY, EMPTY_OPOKA, SECTOR_COLUMNS,
+                           FleetConfig, OpokaRecord, to_day)
+from opoka_timing import span
+
+# pandas, openpyxl, pyarrow и расчетный модуль импортируются только там, где
+# нужны: команды, работающие с одной историей, запускаются без них
+HAS_FEATHER = importlib.util.find_spec('pyarrow') is not None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Версия формата файла истории: {"schema": N, "flasks": {номер опоки: запись}}.
+# Файл без поля schema - старый формат версии 1 (записи верхнего уровня)
+HISTORY_SCHEMA = 2
+
+
+def create_data_manager(backend=None, fleet=None):
+    """Создает хранилище данных: 'json' (по умолчанию) или 'sqlite'.
+
+    Если backend не указан, он берется из переменной окружения OPOKA_BACKEND.
+    fleet - конфигурация парка опок (FleetConfig), по умолчанию парк из 11 опок.
+    """
+    backend = backend or os.environ.get('OPOKA_BACKEND', 'json')
+    if backend == 'sqlite':
+        from opoka_sqlite import SqliteDataManager
+        return SqliteDataManager(fleet=fleet)
+    if backend != 'json':
+        raise ValueError(f"Неизвестное хранилище данных: {backend}")
+    return OpokaDataManager(fleet)
+
+
+def file_content_hash(path, chunk_size=1024 * 1024):
+    """Считает хеш содержимого файла, читая его блоками"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def parse_date_text(text):
+    """Разбирает дату плавки в формате ДД.ММ.ГГГГ в номер дня от 1970-01-01"""
+    return to_day(datetime.strptime(text, '%d.%m.%Y'))
+
+
+def dumps_json(data):
+    """JSON в bytes: через orjson, если он установлен, иначе модулем json"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=4).encode('utf-8')
+
+
+def loads_json(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def upgrade_history_v1(data):
+    """Записи истории формата версии 1 в текущем виде.
+
+    Ранние версии хранили только счетчик (число) или запись без части полей;
+    недостающие поля получают значения по умолчанию, всего использований -
+    текущий счетчик.
+    """
+    flasks = {}
+    for key, value in data.items():
+        if isinstance(value, (int, float)):
+            value = {"count": value}
+        record = OpokaRecord.from_dict(value)
+        if "total_count" not in value:
+            record.total_count = record.count
+        flasks[key] = record.to_dict()
+    return flasks
+
+
+def parse_day(value):
+    """Переводит ячейку даты плавки в номер дня от 1970-01-01"""
+    if value is None:
+        return EMPTY_DAY
+    if isinstance(value, date):
+        return to_day(value)
+    try:
+        return parse_date_text(value.strip())
+    except (AttributeError, ValueError):
+        raise ValueError("дата должна быть датой Excel или текстом ДД.ММ.ГГГГ") from None
+
+
+def parse_opoka(value):
+    """Переводит ячейку сектора в номер опоки"""
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        return EMPTY_OPOKA
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not number.is_integer() or number < 0:
+        raise ValueError("номер опоки должен быть целым неотрицательным числом")
+    # 0 в журнале означает пустой сектор, как и пустая ячейка
+    return int(number)
+
+
+# Ячейка журнала, которую не удалось разобрать: строка листа, колонка,
+# исходное значение и причина
+QuarantinedCell = namedtuple('QuarantinedCell', ['row', 'column', 'value', 'error'])
+
+# Коды типов array для номеров опок
+OPOKA_TYPECODES = {np.dtype(np.uint8): 'B', np.dtype(np.uint16): 'H'}
+
+
+def opoka_dtype(opoka_nums):
+    """Наименьший тип для номеров опок парка: uint8, если все номера меньше 256"""
+    return np.uint8 if max(opoka_nums, default=0) <= np.iinfo(np.uint8).max else np.uint16
+
+
+# Результат чтения журнала: дни, опоки и номера строк листа разобранных строк,
+# последняя строка листа с данными, ячейки с ошибками, хеш всех строк с данными
+# и хеш строк до known_rows включительно
+PlavkaRows = namedtuple('PlavkaRows', ['days', 'opokas', 'sheet_rows', 'last_row',
+                                       'quarantine', 'digest', 'prefix_digest'])
+
+
+def read_plavka_rows(path, opoka_nums, sector_columns=SECTOR_COLUMNS, known_rows=0):
+    """Потоково читает журнал плавок и возвращает PlavkaRows.
+
+    Из листа берутся только дата плавки и колонки секторов. Значения сразу
+    складываются в плотные буферы: номера дней (int32), номера опок по
+    секторам (opoka_dtype парка opoka_nums) и номера строк листа (int32).
+    Полностью пустые строки пропускаются.
+
+    Строки листа до known_rows включительно (уже учтенные в копии) не
+    разбираются, а только входят в prefix_digest: по нему видно, не изменили
+    ли их. Хеш считается по исходным значениям ячеек вместе с номером строки.
+    Пропустить эти строки дешевле нельзя: openpyxl в режиме read_only все
+    равно разбирает XML каждой строки (и с min_row), а хеш добавляет к этому
+    лишь несколько процентов, поэтому сверяются все учтенные строки.
+
+    Ячейка, которую не удалось разобрать, не прерывает чтение: она считается
+    пустой (EMPTY_DAY / EMPTY_OPOKA) и попадает в список QuarantinedCell.
+    Туда же попадают номера опок, которых нет в парке.
+    """
+    import openpyxl
+
+    sector_columns = list(sector_columns)
+    fleet = set(opoka_nums)
+    dtype = opoka_dtype(fleet)
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
+        positions = [header.index(col) for col in [DATE_COLUMN] + sector_columns]
+        max_col = max(positions) + 1
+
+        days = array('i')
+        opokas = array(OPOKA_TYPECODES[np.dtype(dtype)])
+        sheet_rows = array('i')
+        quarantine = []
+        digest = hashlib.sha1()
+        prefix_digest = None
+        last_row = 1
+        rows = sheet.iter_rows(min_row=2, max_col=max_col, values_only=True)
+        for row_num, values in enumerate(rows, start=2):
+            cells = [values[pos] if pos < len(values) else None for pos in positions]
+            if all(cell is None for cell in cells):
+                continue
+            if row_num > known_rows and prefix_digest is None:
+                prefix_digest = digest.hexdigest()
+            digest.update(repr((row_num, cells)).encode())
+            last_row = row_num
+            if row_num <= known_rows:
+                continue
+
+            sheet_rows.append(row_num)
+            try:
+                days.append(parse_day(cells[0]))
+            except (ValueError, OverflowError) as e:
+                quarantine.append(QuarantinedCell(row_num, DATE_COLUMN, cells[0], str(e)))
+                days.append(EMPTY_DAY)
+
+            for column, cell in zip(sector_columns, cells[1:]):
+                try:
+                    number = parse_opoka(cell)
+                    # Номер не из парка (обычно опечатка) не учитывается, иначе
+                    # агрегаты пришлось бы растягивать до него
+                    if number != EMPTY_OPOKA and number not in fleet:
+                        raise ValueError("опоки с таким номером нет в парке")
+                except ValueError as e:
+                    quarantine.append(QuarantinedCell(row_num, column, cell, str(e)))
+                    number = EMPTY_OPOKA
+                opokas.append(number)
+    finally:
+        workbook.close()
+
+    return PlavkaRows(np.frombuffer(days, dtype=np.int32),
+                      np.frombuffer(opokas, dtype=dtype).reshape(-1, len(sector_columns)),
+                      np.frombuffer(sheet_rows, dtype=np.int32),
+                      last_row,
+                      quarantine,
+                      digest.hexdigest(),
+                      prefix_digest or digest.hexdigest())
+
+
+class OpokaDataManager:
+    def __init__(self, fleet=None):
+        self.fleet = fleet or FleetConfig()
+        self.filename = 'opoka_usage_history.json'
+        self.excel_file = 'plavka.xlsx'
+        # Бинарная копия журнала плавок и его агрегаты рядом с исходным файлом
+        sidecar_ext = '.cache.feather' if HAS_FEATHER else '.cache.npz'
+        self.sidecar_file = self.excel_file + sidecar_ext
+        self.aggregates_file = self.excel_file + '.aggregates.npz'
+        # Отчет о ячейках журнала, которые не удалось разобрать
+        self.quarantine_file = self.excel_file + '.quarantine.json'
+        # Ремонты и ручные поправки хранятся событиями в журнале ремонтов,
+        # история - итоговое состояние опок по нему и журналу плавок
+        self.repair_journal = RepairJournal('opoka_repairs.jsonl')
+        self.aggregates = None
+        self.quarantine = []
+        # Компактный журнал (дни, опоки, номера строк листа) и индекс использований по опокам,
+        # индекс строится при первом запросе
+        self.rows = None
+        self._timeline = None
+        # (хеш прежней версии журнала, число ее строк), если последняя загрузка
+        # только дописала строки к копии, иначе None
+        self.appended = None
+
+    def load_history(self):
+        """Читает историю в виде {номер опоки: OpokaRecord}. Опоки парка,
+        которых нет в файле, получают пустые записи. Файл старого формата
+        один раз переводится в текущий (migrate_history)"""
+        history = {i: OpokaRecord() for i in self.fleet.opoka_nums}
+        try:
+            with open(self.filename, 'rb') as f:
+                data = loads_json(f.read())
+        except FileNotFoundError:
+            return history
+
+        schema = data.get("schema", 1)
+        if schema != HISTORY_SCHEMA:
+            data = self.migrate_history(data, schema)
+        for key, value in data["flasks"].items():
+            history[int(key)] = OpokaRecord(**value)
+        return history
+
+    def migrate_history(self, data, schema):
+        """Переводит историю версии schema в текущую схему и перезаписывает файл,
+        сохранив исходный рядом (.v<версия>.bak)"""
+        if schema > HISTORY_SCHEMA:
+            raise ValueError(f"Файл истории {self.filename} записан более новой версией "
+                             f"программы (схема {schema})")
+        data = {"schema": HISTORY_SCHEMA, "flasks": upgrade_history_v1(data)}
+
+        backup_file = f"{self.filename}.v{schema}.bak"
+        if not os.path.exists(backup_file):
+            shutil.copy2(self.filename, backup_file)
+        self.write_history_file(data)
+        return data
+
+    def watched_files(self):
+        """Файлы, изменение которых требует обновить данные окна"""
+        return [self.excel_file, self.filename, self.repair_journal.path]
+
+    def history_file_stat(self):
+        """Время изменения и размер файла истории или None, если файла нет"""
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def save_history(self, history, opoka_nums=None):
+        """Сохраняет историю. opoka_nums - измененные опоки; JSON-файл
+        все равно переписывается целиком"""
+        self.write_history_file({
+            "schema": HISTORY_SCHEMA,
+            "flasks": {str(key): record.to_dict() for key, record in history.items()}
+        })
+
+    def write_history_file(self, data):
+        # Пишем во временный файл и подменяем им историю, чтобы сбой
+        # во время записи не оставил обрезанный JSON
+        tmp_file = self.filename + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(dumps_json(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.filename)
+
+    def load_plavka(self, content_hash=None):
+        """Загружает журнал плавок в компактном виде (self.rows).
+
+        Если бинарная копия построена по той же версии файла (сверяется хеш
+        содержимого), Excel не разбирается. Если в файл только дописали строки
+        в конец (хеш уже учтенных строк не изменился), разбираются лишь новые
+        строки и добавляются к копии и агрегатам; лист при этом все равно
+        читается целиком, экономятся перевод значений и пересчет агрегатов.
+        При любом другом изменении журнал перечитывается целиком.
+        После загрузки актуальные агрегаты лежат в self.aggregates, а ячейки,
+        которые не удалось разобрать, - в self.quarantine (и в quarantine_file).
+        """
+        from opoka_engine import UsageAggregates
+
+        if content_hash is None:
+            content_hash = file_content_hash(self.excel_file)
+
+        try:
+            with span('read_cache'):
+                sidecar = self.read_sidecar()
+        except Exception as e:
+            print(f"Не удалось прочитать кеш журнала плавок: {str(e)}")
+            sidecar = None
+
+        # Копия без отчета об ошибках разбора (построенная прежней версией
+        # программы) перестраивается, чтобы отчет был полным
+        quarantine = None
+        if sidecar is not None and sidecar[4] == content_hash:
+            quarantine = self.load_quarantine(content_hash)
+
+        self.appended = None
+        if quarantine is not None:
+            days, opokas, sheet_rows = sidecar[:3]
+            with span('aggregate'):
+                self.aggregates = (self.load_aggregates(content_hash, len(days))
+                                   or UsageAggregates.from_rows(self.fleet.opoka_nums, days, opokas))
+            self.quarantine = quarantine
+            self.set_rows(days, opokas, sheet_rows)
+            return
+
+        appended = None
+        if sidecar is not None and len(sidecar[0]) > 0:
+            days, opokas, sheet_rows, last_row, source_hash, rows_digest = sidecar
+            with span('read_excel'):
+                appended = self.read_appended_rows(last_row, rows_digest)
+
+        previous_quarantine = None
+        if appended is not None:
+            previous_quarantine = self.load_quarantine(source_hash)
+
+        if previous_quarantine is not None:
+            # Дописываем новые строки к копии и агрегатам
+            new_days, new_opokas, new_sheet_rows, last_row, new_quarantine, rows_digest, _ = \
+                appended
+            with span('aggregate'):
+                aggregates = (self.load_aggregates(source_hash, len(days))
+                              or UsageAggregates.from_rows(self.fleet.opoka_nums, days, opokas))
+                aggregates.add(new_days, new_opokas)
+            days = np.concatenate([days, new_days])
+            opokas = np.concatenate([opokas, new_opokas])
+            sheet_rows = np.concatenate([sheet_rows, new_sheet_rows])
+            quarantine = previous_quarantine + new_quarantine
+            self.appended = (source_hash, len(days) - len(new_days))
+        else:
+            # Полное перестроение журнала и агрегатов
+            with span('read_excel'):
+                days, opokas, sheet_rows, last_row, quarantine, rows_digest, _ = read_plavka_rows(
+                    self.excel_file, self.fleet.opoka_nums, self.fleet.sector_columns
+                )
+            with span('aggregate'):
+                aggregates = UsageAggregates.from_rows(self.fleet.opoka_nums, days, opokas)
+
+        try:
+            with span('write_cache'):
+                self.write_sidecar(days, opokas, sheet_rows, last_row, content_hash, rows_digest)
+                self.save_aggregates(aggregates, content_hash)
+                self.save_quarantine(quarantine, content_hash)
+        except Exception as e:
+            print(f"Не удалось сохранить кеш журнала плавок: {str(e)}")
+
+        self.aggregates = aggregates
+        self.quarantine = quarantine
+        self.set_rows(days, opokas, sheet_rows)
+
+    def set_rows(self, days, opokas, sheet_rows):
+        self.rows = (days, opokas, sheet_rows)
+        self._timeline = None
+
+    @property
+    def timeline(self):
+        """Индекс использований по опокам (UsageTimeline) для загруженного журнала"""
+        from opoka_engine import UsageTimeline
+
+        if self._timeline is None:
+            with span('timeline'):
+                self._timeline = UsageTimeline.from_rows(*self.rows[:2])
+        return self._timeline
+
+    def last_use(self, opoka_num):
+        """Дата последнего использования опоки по последнему загруженному журналу"""
+        return self.aggregates.last_use(opoka_num)
+
+    def uses_since(self, opoka_num, date):
+        """Количество использований опоки строго после даты date"""
+        return self.timeline.uses_since(opoka_num, date)
+
+    def usage_stats(self, opoka_nums, repair_dates):
+        """Последнее использование, использования после ремонта и всего по опокам
+        по загруженному журналу (load_plavka)"""
+        import pandas as pd
+
+        # Отвечают индекс и агрегаты, без прохода по строкам журнала
+        repair_dates = repair_dates or {}
+        opoka_nums = list(opoka_nums)
+        timeline = self.timeline
+        stats = pd.DataFrame(index=pd.Index(opoka_nums, name='opoka'))
+        stats['last_use'] = pd.to_datetime(
+            [timeline.last_use(i) for i in opoka_nums]
+        ).as_unit('ns')
+        stats['total_uses'] = [self.aggregates.total(i) for i in opoka_nums]
+        stats['uses_since_repair'] = [
+            timeline.uses_since(i, repair_dates[i]) if i in repair_dates else 0
+            for i in opoka_nums
+        ]
+        return stats
+
+    def state_as_of(self, date, opoka_nums):
+        """Что показывали счетчики опок на конец дня date: {номер опоки: OpokaRecord}.
+
+        События журнала ремонтов до date проигрываются по порядку, и счетчик
+        считается так же, как в apply_usage_stats: от последнего ремонта или
+        более поздней поправки на ту дату.
+        """
+        repairs = self.repair_journal.state_as_of(date.isoformat())
+        timeline = self.timeline
+        states = {}
+        for opoka_num in opoka_nums:
+            flask = repairs.get(opoka_num) or FlaskRepairs()
+            states[opoka_num] = timeline.state_as_of(
+                opoka_num, date, flask.reference(),
+                repair_count=flask.repair_count,
+                last_repair_date=flask.last_repair_date,
+                in_repair=flask.in_repair
+            )
+        return states
+
+    def migrate_repairs(self, history):
+        """Начинает журнал ремонтов с состояния опок из истории, если журнала еще нет"""
+        if not self.repair_journal.exists():
+            self.repair_journal.migrate(history, date.today().isoformat())
+
+    def load_repairs(self):
+        """Состояние ремонтов опок по журналу: {номер опоки: FlaskRepairs}"""
+        with span('repairs'):
+            return self.repair_journal.state()
+
+    def repairs_in_month(self, history, month):
+        """Количество ремонтов в месяце month (ГГГГ-ММ) по журналу ремонтов.
+
+        Счетчики по месяцам хранятся в состоянии журнала и его снимке, поэтому
+        файл журнала целиком не читается.
+        """
+        return self.repair_journal.repairs_in_month(month)
+
+    def repair_history(self, history):
+        """События журнала ремонтов (опока, дата, вид) в порядке дат.
+
+        Вид - 'repair', 'return' или 'correction'; ремонт, перенесенный
+        поправкой из времени до журнала, тоже считается 'repair'.
+        """
+        events = []
+        for event in self.repair_journal.events():
+            opoka_num = event['opoka']
+            if event['kind'] == REPAIR_OUT:
+                events.append((opoka_num, event['date'], 'repair'))
+            elif event['kind'] == REPAIR_RETURN:
+                events.append((opoka_num, event['date'], 'return'))
+            elif event['kind'] == CORRECTION:
+                if event.get('last_repair_date'):
+                    events.append((opoka_num, event['last_repair_date'], 'repair'))
+                events.append((opoka_num, event['date'], 'correction'))
+        return sorted(events, key=lambda event: (event[1], event[0]))
+
+    def read_appended_rows(self, last_row, rows_digest):
+        """Читает строки, дописанные после последней учтенной строки листа (PlavkaRows).
+
+        Хеш учтенных строк сверяется с сохраненным в копии; если хотя бы одну из
+        них изменили, вставили или удалили, возвращается None и журнал нужно
+        перечитать целиком.
+        """
+        rows = read_plavka_rows(self.excel_file, self.fleet.opoka_nums,
+                                self.fleet.sector_columns, known_rows=last_row)
+        if rows.prefix_digest != rows_digest:
+            return None
+        return rows
+
+    def read_sidecar(self):
+        """Возвращает (дни, опоки, номера строк листа, последняя строка листа,
+        хеш исходного файла, хеш учтенных строк) из бинарной копии или None, если копии нет или она
+        построена для другого набора колонок секторов, другого парка опок
+        или прежней версией"""
+        if not os.path.exists(self.sidecar_file):
+            return None
+
+        sector_columns = self.fleet.sector_columns
+        if HAS_FEATHER:
+            import pyarrow.feather as feather
+
+            table = feather.read_table(self.sidecar_file)
+            if table.column_names != ['days', 'sheet_rows'] + sector_columns:
+                return None
+            metadata = table.schema.metadata or {}
+            if b'rows_digest' not in metadata or b'opoka_nums' not in metadata:
+                return None
+            days = table.column('days').to_numpy()
+            sheet_rows = table.column('sheet_rows').to_numpy()
+            opokas = np.column_stack([
+                table.column(col).to_numpy() for col in sector_columns
+            ]).reshape(-1, len(sector_columns))
+            last_row = int(metadata[b'last_row'])
+            source_hash = metadata[b'source_hash'].decode()
+            rows_digest = metadata[b'rows_digest'].decode()
+            opoka_nums = json.loads(metadata[b'opoka_nums'])
+        else:
+            with np.load(self.sidecar_file) as data:
+                if 'sectors' not in data or data['sectors'].tolist() != sector_columns \
+                        or 'rows_digest' not in data or 'opoka_nums' not in data:
+                    return None
+                days = data['days']
+                opokas = data['opokas']
+                sheet_rows = data['sheet_rows']
+                last_row = int(data['last_row'])
+                source_hash = str(data['source_hash'])
+                rows_digest = str(data['rows_digest'])
+                opoka_nums = data['opoka_nums'].tolist()
+        # Номера не из парка при чтении попадают в отчет об ошибках: если парк
+        # изменился, журнал нужно перечитать, иначе новые опоки остались бы в отчете
+        if sorted(opoka_nums) != sorted(self.fleet.opoka_nums):
+            return None
+        return days, opokas, sheet_rows, last_row, source_hash, rows_digest
+
+    def write_sidecar(self, days, opokas, sheet_rows, last_row, content_hash, rows_digest):
+        tmp_file = self.sidecar_file + '.tmp'
+
+        if HAS_FEATHER:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+
+            columns = {'days': days, 'sheet_rows': sheet_rows}
+            columns.update({col: opokas[:, i] for i, col in enumerate(self.fleet.sector_columns)})
+            table = pa.table(columns).replace_schema_metadata({
+                'source_hash': content_hash,
+                'last_row': str(last_row),
+                'rows_digest': rows_digest,
+                'opoka_nums': json.dumps(self.fleet.opoka_nums)
+            })
+            feather.write_feather(table, tmp_file)
+        else:
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, days=days, opokas=opokas, sheet_rows=sheet_rows,
+                         last_row=np.array(last_row),
+                         source_hash=np.array(content_hash),
+                         rows_digest=np.array(rows_digest),
+                         opoka_nums=np.array(self.fleet.opoka_nums, dtype=np.int64),
+                         sectors=np.array(self.fleet.sector_columns))
+
+        # Копия подменяется целиком, чтобы не оставить недописанный файл
+        os.replace(tmp_file, self.sidecar_file)
+
+    def load_aggregates(self, source_hash, row_count):
+        """Загружает сохраненные агрегаты, если они построены по той же копии журнала
+        для того же парка"""
+        from opoka_engine import UsageAggregates
+
+        try:
+            with np.load(self.aggregates_file) as data:
+                if str(data['source_hash']) != source_hash:
+                    return None
+                aggregates = UsageAggregates.from_arrays(data)
+        except (OSError, KeyError, ValueError):
+            return None
+        if aggregates.row_count != row_count \
+                or aggregates.opoka_nums.tolist() != self.fleet.opoka_nums:
+            return None
+        return aggregates
+
+    def load_quarantine(self, source_hash):
+        """Ячейки с ошибками из отчета, если он построен по той же версии журнала,
+        иначе None"""
+        try:
+            with open(self.quarantine_file, encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if report.get('source_hash') != source_hash:
+            return None
+        return [QuarantinedCell(cell['row'], cell['column'], cell['value'], cell['error'])
+                for cell in report['cells']]
+
+    def save_quarantine(self, quarantine, content_hash):
+        report = {
+            "source_hash": content_hash,
+            "file": self.excel_file,
+            "cells": [
+                {
+                    "row": cell.row,
+                    "column": cell.column,
+                    "value": cell.value if isinstance(cell.value, (int, float, str)) or
+                    cell.value is None else str(cell.value),
+                    "error": cell.error
+                }
+                for cell in quarantine
+            ]
+        }
+        tmp_file = self.quarantine_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_file, self.quarantine_file)
+
+    def save_aggregates(self, aggregates, content_hash):
+        tmp_file = self.aggregates_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, source_hash=np.array(content_hash), **aggregates.to_arrays())
+        os.replace(tmp_file, self.aggregates_file)
+
+
+class DataCache:
+    """Общий кеш разобранного журнала плавок.
+
+    Журнал загружается в data_manager и перечитывается только когда файл
+    действительно изменился на диске:
+    сначала сравниваются время изменения и размер, а при их расхождении -
+    хеш содержимого. version увеличивается при каждой замене данных, по нему
+    можно сбрасывать производные агрегаты.
+
+    Таблицы месяцев берутся из куба использований в агрегатах и держатся в
+    LRU-кеше объемом не больше month_cache_bytes; при смене версии данных кеш
+    очищается.
+    """
+
+    def __init__(self, data_manager, month_cache_bytes=16 * 1024 * 1024):
+        self.data_manager = data_manager
+        self.loaded = False
+        self.version = 0
+        self.file_stat = None
+        self.content_hash = None
+        self.month_cache = OrderedDict()  # (версия, год, месяц, опоки) -> матрица
+        self.month_cache_bytes = month_cache_bytes
+        # Журнал может загружаться из фонового потока
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Загружает журнал, если файл изменился; возвращает version"""
+        with self.lock:
+            self._load()
+            return self.version
+
+    def _load(self):
+        stat = os.stat(self.data_manager.excel_file)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if self.loaded and file_stat == self.file_stat:
+            return
+
+        with span('hash'):
+            content_hash = file_content_hash(self.data_manager.excel_file)
+        if not self.loaded or content_hash != self.content_hash:
+            self.data_manager.load_plavka(content_hash)
+            self.loaded = True
+            self.content_hash = content_hash
+            self.version += 1
+        self.file_stat = file_stat
+
+    def get_aggregates(self):
+        """Агрегаты журнала (UsageAggregates) для текущей версии данных"""
+        with self.lock:
+            self._load()
+            return self.data_manager.aggregates
+
+    def month_grid(self, year, month, opoka_nums, check_file=True):
+        """Матрица использований месяца (опоки x дни) для текущей версии данных.
+
+        check_file=False берет уже загруженные данные без проверки файла, чтобы
+        переключение месяца в окне не запускало чтение журнала.
+        """
+        with self.lock:
+            if check_file or not self.loaded:
+                self._load()
+
+            key = (self.version, year, month, tuple(opoka_nums))
+            grid = self.month_cache.get(key)
+            if grid is not None:
+                self.month_cache.move_to_end(key)
+                return grid
+
+            grid = self.data_manager.aggregates.month_grid(year, month, opoka_nums)
+            # Таблицы прежних версий данных больше не понадобятся
+            for old_key in [k for k in self.month_cache if k[0] != self.version]:
+                del self.month_cache[old_key]
+            self.month_cache[key] = grid
+            while (len(self.month_cache) > 1 and
+                   sum(g.nbytes for g in self.month_cache.values()) > self.month_cache_bytes):
+                self.month_cache.popitem(last=False)
+            return grid
+
+    def rows(self):
+        """Компактный журнал (дни, опоки, номера строк листа) для текущей
+        версии данных.
+
+        Массивы при перечитывании файла заменяются новыми, а не меняются,
+        поэтому полученные массивы можно читать вне блокировки.
+        """
+        with self.lock:
+            self._load()
+            return self.data_manager.rows
+
+    def months(self):
+        """Месяцы журнала с плавками, (год, месяц) по возрастанию"""
+        with self.lock:
+            return self.data_manager.aggregates.months()
+
+
+class RefreshCancelled(Exception):
+    """Расчет отменен, потому что пользователь запросил более новые данные"""
+
+
+def compute_refresh(data_cache, repair_dates, year, month, opoka_nums,
+                    cancel_event=None, progress=None):
+    """Загружает журнал плавок и считает все данные для обновления окна.
+
+    Не использует Qt и может выполняться в фоновом потоке. cancel_event
+    (threading.Event) проверяется между этапами; если он установлен,
+    выбрасывается RefreshCancelled. progress(процент, текст) сообщает этап.
+    """
+    def stage(percent, text):
+        if cancel_event is not None and cancel_event.is_set():
+            raise RefreshCancelled()
+        if progress is not None:
+            progress(percent, text)
+
+    opoka_nums = list(opoka_nums)
+
+    stage(10, "Загрузка журнала плавок")
+    with span('load'):
+        data_cache.load()
+
+    stage(50, "Подсчет использований")
+    with span('usage_stats'):
+        usage_stats = data_cache.data_manager.usage_stats(opoka_nums, repair_dates)
+
+    stage(80, "Расчет таблицы месяца")
+    with span('month_grid'):
+        month_grid = data_cache.month_grid(year, month, opoka_nums)
+
+    stage(100, "Готово")
+    return {
+        "version": data_cache.version,
+        "usage_stats": usage_stats,
+        "month_grid": month_grid,
+        "months": data_cache.months(),
+        "quarantine": len(data_cache.data_manager.quarantine)
+    }
+
+
+def collect_repair_dates(repairs, opoka_nums):
+    """Даты, от которых считаются текущие счетчики опок: последний ремонт
+    или более поздняя ручная поправка из журнала ремонтов"""
+    repair_dates = {}
+    for opoka_num in opoka_nums:
+        reference = repairs[opoka_num].reference() if opoka_num in repairs else None
+        if reference is not None:
+            repair_dates[opoka_num] = datetime.strptime(reference[0], '%Y-%m-%d')
+    return repair_dates
+
+
+def apply_usage_stats(history_store, usage_stats, repairs, opoka_nums, repair_limit):
+    """Переносит в историю состояние опок по журналу ремонтов и журналу плавок.
+
+    Счетчик - значение в точке отсчета (ремонт или поправка) плюс использования
+    после нее; у опоки без ремонтов и поправок - все ее использования. Всего
+    использований - все использования опоки по журналу плавок.
+    Возвращает номера опок не в ремонте, достигших лимита использований.
+    """
+    import pandas as pd
+
+    over_limit = []
+    for opoka_num in opoka_nums:
+        last_use = usage_stats.at[opoka_num, 'last_use']
+        flask = repairs.get(opoka_num) or FlaskRepairs()
+        reference = flask.reference()
+        total_count = int(usage_stats.at[opoka_num, 'total_uses'])
+        if reference is None:
+            count = total_count
+        else:
+            count = reference[1] + int(usage_stats.at[opoka_num, 'uses_since_repair'])
+        history_store.update(
+            opoka_num,
+            last_use=last_use.strftime('%Y-%m-%d') if pd.notna(last_use) else None,
+            count=count,
+            total_count=total_count,
+            repair_count=flask.repair_count,
+            last_repair_date=flask.last_repair_date,
+            in_repair=flask.in_repair
+        )
+        if count >= repair_limit and not flask.in_repair:
+            over_limit.append(opoka_num)
+    return over_limit
+
+
+def record_repair(data_manager, history_store, kind, opoka_num, date, **fields):
+    """Записывает событие в журнал ремонтов и сразу переносит его в историю,
+    не дожидаясь пересчета по журналу плавок"""
+    data_manager.repair_journal.append(kind, opoka_num, date, **fields)
+    flask = data_manager.repair_journal.state()[int(opoka_num)]
+    changes = {
+        "repair_count": flask.repair_count,
+        "last_repair_date": flask.last_repair_date,
+        "in_repair": flask.in_repair
+    }
+    if kind == REPAIR_OUT:
+        changes["count"] = 0
+    elif 'count' in fields:
+        changes["count"] = fields['count']
+    history_store.update(opoka_num, **changes)
+
+
+class HistoryStore:
+    """История использования опок в памяти с отложенной записью на диск.
+
+    Файл истории читается один раз, дальше все чтения идут из памяти. Изменения
+    помечают опоку как измененную и вызывают on_dirty - через него окно
+    откладывает запись по таймеру. flush() записывает историю, только если
+    есть несохраненные изменения, и вызывается также при выходе из программы.
+    version увеличивается при каждом изменении истории в памяти.
+    """
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+        self.history = None
+        self.version = 0
+        self.file_stat = None
+        self.dirty = set()
+        self.on_dirty = None
+        atexit.register(self.flush)
+
+    def get(self):
+        if self.history is None:
+            self.history = self.data_manager.load_history()
+            self.file_stat = self.data_manager.history_file_stat()
+            self.version += 1
+        return self.history
+
+    def reload_if_changed(self):
+        """Перечитывает историю, если файл изменили извне.
+
+        Возвращает номера опок, записи которых изменились. Пока есть
+        несохраненные изменения, файл не перечитывается - они его перезапишут.
+        """
+        stat = self.data_manager.history_file_stat()
+        if self.history is None or self.dirty or stat is None or stat == self.file_stat:
+            return set()
+
+        history = self.data_manager.load_history()
+        changed = {key for key in history if history[key] != self.history.get(key)}
+        self.history = history
+        self.file_stat = stat
+        if changed:
+            self.version += 1
+        return changed
+
+    def update(self, opoka_num, **fields):
+        """Обновляет поля записи опоки, помечая ее измененной только при реальных изменениях"""
+        record = self.get()[int(opoka_num)]
+        changed = {key: value for key, value in fields.items()
+                   if getattr(record, key) != value}
+        if changed:
+            for key, value in changed.items():
+                setattr(record, key, value)
+            self.mark_dirty(opoka_num)
+
+    def mark_dirty(self, opoka_num):
+        self.dirty.add(int(opoka_num))
+        self.version += 1
+        if self.on_dirty is not None:
+            self.on_dirty()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        with span('save_history'):
+            self.data_manager.save_history(self.history, sorted(self.dirty))
+        self.file_stat = self.data_manager.history_file_stat()
+        self.dirty.clear()
@@ -0,0 +1,218 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from opoka_records import EMPTY_DAY, EMPTY_OPOKA, OpokaRecord, day_to_date, to_day
+
+
+class UsageAggregates:
+    """Накопительные агрегаты журнала плавок в компактном виде.
+
+    Хранит по опокам парка общее количество использований и день последнего
+    использования, а по месяцам - матрицы использований (опока x день) в int32:
+    вместе они образуют куб опока x месяц x день для всего журнала.
+    Новые плавки добавляются через add() без пересчета уже учтенных строк.
+    Массивы индексируются позицией опоки в opoka_nums, поэтому их размер
+    задается парком, а не наибольшим номером в журнале.
+    """
+
+    def __init__(self, opoka_nums):
+        self.opoka_nums = np.asarray(list(opoka_nums), dtype=np.int64)
+        size = len(self.opoka_nums)
+        # Позиция опоки в массивах по ее номеру, -1 - опоки нет в парке
+        self.positions = np.full(int(self.opoka_nums.max(initial=0)) + 1, -1, dtype=np.int64)
+        self.positions[self.opoka_nums] = np.arange(size)
+        self.row_count = 0
+        self.total_uses = np.zeros(size, dtype=np.int64)
+        self.last_use_day = np.full(size, EMPTY_DAY, dtype=np.int64)
+        self.month_grids = {}  # номер месяца от 1970-01 -> массив int32 (опока, 31)
+
+    @classmethod
+    def from_rows(cls, opoka_nums, days, opokas):
+        aggregates = cls(opoka_nums)
+        aggregates.add(days, opokas)
+        return aggregates
+
+    def position(self, opoka_nums):
+        """Позиции опок в массивах агрегатов, -1 для номеров не из парка"""
+        opoka_nums = np.asarray(opoka_nums, dtype=np.int64)
+        known = (opoka_nums >= 0) & (opoka_nums < len(self.positions))
+        result = np.full(opoka_nums.shape, -1, dtype=np.int64)
+        result[known] = self.positions[opoka_nums[known]]
+        return result
+
+    def add(self, days, opokas):
+        """Учитывает новые строки журнала: days - номера дней (int32),
+        opokas - номера опок по секторам (EMPTY_OPOKA для пустых ячеек)"""
+        self.row_count += len(days)
+        rows, cols = np.nonzero(opokas != EMPTY_OPOKA)
+        ids = self.position(opokas[rows, cols])
+        known = ids >= 0
+        rows, ids = rows[known], ids[known]
+        if len(rows) == 0:
+            return
+
+        size = len(self.total_uses)
+        self.total_uses += np.bincount(ids, minlength=size)
+
+        # Для дат и месяцев нужны только плавки с датой
+        use_days = days[rows].astype(np.int64)
+        dated = use_days != EMPTY_DAY
+        ids = ids[dated]
+        use_days = use_days[dated]
+        np.maximum.at(self.last_use_day, ids, use_days)
+
+        dates = use_days.astype('datetime64[D]')
+        months = dates.astype('datetime64[M]')
+        day_index = (dates - months.astype('datetime64[D]')).astype(np.int64)
+        # Все затронутые месяцы считаются одним проходом: куб (месяц, опока, день)
+        unique_months, month_index = np.unique(months.astype(np.int64), return_inverse=True)
+        cube = np.bincount(
+            (month_index * size + ids) * 31 + day_index,
+            minlength=len(unique_months) * size * 31
+        ).reshape(len(unique_months), size, 31)
+        for month, grid in zip(unique_months, cube):
+            self.month_grids[int(month)] = (self._month_grid(int(month)) + grid).astype(np.int32)
+
+    def _month_grid(self, month):
+        grid = self.month_grids.get(month)
+        if grid is None:
+            return np.zeros((len(self.total_uses), 31), dtype=np.int32)
+        return grid
+
+    def month_grid(self, year, month, opoka_nums):
+        """Матрица использований месяца размером (количество опок, дней в месяце):
+        строки идут в порядке opoka_nums, столбец d соответствует дню d + 1"""
+        days_in_month = calendar.monthrange(year, month)[1]
+        positions = self.position(list(opoka_nums))
+        grid = self.month_grids.get((year - 1970) * 12 + month - 1)
+
+        result = np.zeros((len(positions), days_in_month), dtype=np.int64)
+        if grid is not None:
+            known = positions >= 0
+            result[known] = grid[positions[known], :days_in_month]
+        return result
+
+    def months(self):
+        """Месяцы журнала с плавками в виде пар (год, месяц) по возрастанию"""
+        return [(1970 + month // 12, month % 12 + 1) for month in sorted(self.month_grids)]
+
+    def total(self, opoka_num):
+        """Общее количество использований опоки"""
+        position = self.position(opoka_num)
+        return int(self.total_uses[position]) if position >= 0 else 0
+
+    def last_use(self, opoka_num):
+        """Дата последнего использования опоки или None"""
+        position = self.position(opoka_num)
+        if position < 0 or self.last_use_day[position] == EMPTY_DAY:
+            return None
+        return pd.Timestamp(day_to_date(self.last_use_day[position]))
+
+    def to_arrays(self):
+        """Представление агрегатов в виде массивов для сохранения в npz"""
+        months = np.array(sorted(self.month_grids), dtype=np.int64)
+        grids = np.stack([self._month_grid(int(m)) for m in months]) if len(months) else (
+            np.zeros((0, len(self.total_uses), 31), dtype=np.int32)
+        )
+        return {
+            'opoka_nums': self.opoka_nums,
+            'row_count': np.array(self.row_count),
+            'total_uses': self.total_uses,
+            'last_use_day': self.last_use_day,
+            'months': months,
+            'grids': grids
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        aggregates = cls(arrays['opoka_nums'])
+        aggregates.row_count = int(arrays['row_count'])
+        aggregates.total_uses = arrays['total_uses'].astype(np.int64)
+        aggregates.last_use_day = arrays['last_use_day'].astype(np.int64)
+        aggregates.month_grids = {
+            int(month): grid.astype(np.int32)
+            for month, grid in zip(arrays['months'], arrays['grids'])
+        }
+        return aggregates
+
+
+class UsageTimeline:
+    """Индекс использований по опокам для запросов на дату.
+
+    Для каждой опоки хранит отсортированные дни использований (и строки
+    журнала) подряд в одном массиве; использования опоки n лежат в
+    days[offsets[n]:offsets[n + 1]]. Позиция внутри отрезка - накопленное
+    количество использований, поэтому последнее использование, использования
+    после даты, между датами и состояние счетчика на дату считаются через
+    searchsorted. Использования без даты плавки в индекс не входят.
+    """
+
+    def __init__(self, days, rows, offsets):
+        self.days = days
+        self.rows = rows
+        self.offsets = offsets
+
+    @classmethod
+    def from_rows(cls, days, opokas):
+        """Строит индекс по компактному журналу (как у UsageAggregates.add)"""
+        rows, cols = np.nonzero(opokas != EMPTY_OPOKA)
+        ids = opokas[rows, cols].astype(np.int64)
+        use_days = days[rows].astype(np.int64)
+        dated = use_days != EMPTY_DAY
+        ids, use_days, rows = ids[dated], use_days[dated], rows[dated]
+
+        order = np.lexsort((rows, use_days, ids))
+        size = int(ids.max()) + 1 if len(ids) else 0
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=size), out=offsets[1:])
+        return cls(use_days[order].astype(np.int32), rows[order].astype(np.int64), offsets)
+
+    def _segment(self, opoka_num):
+        if not 0 <= opoka_num < len(self.offsets) - 1:
+            return self.days[:0], self.rows[:0]
+        start, end = self.offsets[opoka_num], self.offsets[opoka_num + 1]
+        return self.days[start:end], self.rows[start:end]
+
+    def last_use(self, opoka_num, as_of=None):
+        """Дата последнего использования опоки (не позже as_of) или None"""
+        days, _ = self._segment(opoka_num)
+        n = len(days) if as_of is None else self.uses_until(opoka_num, as_of)
+        return pd.Timestamp(day_to_date(days[n - 1])) if n else None
+
+    def uses_until(self, opoka_num, date):
+        """Количество использований опоки по дату date включительно"""
+        days, _ = self._segment(opoka_num)
+        return int(np.searchsorted(days, to_day(date), side='right'))
+
+    def uses_since(self, opoka_num, date):
+        """Количество использований опоки строго после даты date"""
+        days, _ = self._segment(opoka_num)
+        return len(days) - self.uses_until(opoka_num, date)
+
+    def uses_between(self, opoka_num, start, end):
+        """Количество использований опоки с start по end включительно"""
+        days, _ = self._segment(opoka_num)
+        first = np.searchsorted(days, to_day(start), side='left')
+        return max(self.uses_until(opoka_num, end) - int(first), 0)
+
+    def state_as_of(self, opoka_num, date, reference=None, **fields):
+        """Состояние счетчика опоки на конец дня date (OpokaRecord).
+
+        reference - точка отсчета счетчика на эту дату (дата, счетчик на конец
+        даты), как у FlaskRepairs.reference(): счетчик равен значению в ней плюс
+        использования строго после нее по date включительно. Без точки отсчета
+        счетчик - все использования. fields - остальные поля OpokaRecord.
+        """
+        total = self.uses_until(opoka_num, date)
+        count = total
+        if reference is not None:
+            count = reference[1] + max(total - self.uses_until(opoka_num, reference[0]), 0)
+        last_use = self.last_use(opoka_num, as_of=date)
+        return OpokaRecord(
+            count=count,
+            total_count=total,
+            last_use=last_use.strftime('%Y-%m-%d') if last_use is not None else None,
+            **fields
+        )
@@ -0,0 +1,224 @@
+"""Потоковый экспорт статистики, использований опок по плавкам и ремонтов.
+
+Таблицы выгружаются частями по chunk_rows строк, поэтому журнал за годы
+не собирается в памяти целиком:
+
+    statistics - сводка по опокам (как раньше "Экспорт статистики")
+    usages     - каждое использование опоки: строка журнала, дата, сектор, опока
+    repairs    - ремонты опок
+
+Формат выбирается по расширению файла: .csv (модуль csv), .xlsx (openpyxl в
+режиме write_only) или .parquet (pyarrow, группа строк на каждую часть).
+Файл пишется во временный и заменяет итоговый только после успешной записи.
+Для usages и repairs можно задать период дат (включительно); использования
+без даты плавки в выгрузку с периодом не попадают.
+"""
+import os
+from datetime import date
+
+import numpy as np
+
+from opoka_records import EMPTY_DAY, EMPTY_OPOKA, statistics_rows, to_day
+
+TABLES = {
+    'statistics': "Статистика опок",
+    'usages': "Использования по плавкам",
+    'repairs': "История ремонтов",
+}
+
+USAGE_COLUMNS = ['Строка журнала', 'Дата плавки', 'Сектор', 'Опока']
+REPAIR_COLUMNS = ['Опока', 'Дата', 'Событие']
+
+EVENT_NAMES = {'repair': "Ремонт", 'return': "Возврат из ремонта",
+               'correction': "Поправка"}
+
+
+class ExportCancelled(Exception):
+    """Экспорт отменен пользователем"""
+
+
+class CsvWriter:
+    def __init__(self, path, columns):
+        import csv
+
+        # utf-8-sig, чтобы Excel открывал файл с русскими заголовками
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+class XlsxWriter:
+    def __init__(self, path, columns):
+        import openpyxl
+
+        # В режиме write_only строки сразу уходят во временный файл листа
+        self.path = path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(columns)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+    def abort(self):
+        self.workbook.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Для экспорта в Parquet нужен пакет pyarrow")
+
+        self.pa = pa
+        self.path = path
+        self.columns = columns
+        self.pq = pq
+        self.writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        table = self.pa.Table.from_pydict(dict(zip(self.columns, map(list, zip(*rows)))))
+        if self.writer is None:
+            # Схема берется по первой части
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is None:
+            # Пустая выгрузка: файл только с заголовком
+            table = self.pa.table({name: self.pa.array([], self.pa.string())
+                                   for name in self.columns})
+            self.pq.write_table(table, self.path)
+        else:
+            self.writer.close()
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {
+    '.csv': CsvWriter,
+    '.xlsx': XlsxWriter,
+    '.parquet': ParquetWriter,
+}
+
+
+def writer_class(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Неподдерживаемый формат файла: {extension or path} "
+                         f"(доступны {', '.join(WRITERS)})")
+    return WRITERS[extension]
+
+
+def usage_chunks(days, opokas, sheet_rows, sector_columns, start=None, end=None,
+                 chunk_rows=50000):
+    """Использования опок из компактного журнала частями по chunk_rows плавок.
+
+    Возвращает списки строк (строка журнала, дата, сектор, опока); строка
+    журнала - номер строки листа Excel из sheet_rows, как в отчете об ошибках.
+    """
+    sector_columns = list(sector_columns)
+    first_day = to_day(start) if start is not None else None
+    last_day = to_day(end) if end is not None else None
+
+    for offset in range(0, len(days), chunk_rows):
+        chunk_days = days[offset:offset + chunk_rows]
+        mask = opokas[offset:offset + chunk_rows] != EMPTY_OPOKA
+        if first_day is not None or last_day is not None:
+            in_range = chunk_days != EMPTY_DAY
+            if first_day is not None:
+                in_range &= chunk_days >= first_day
+            if last_day is not None:
+                in_range &= chunk_days <= last_day
+            mask &= in_range[:, None]
+
+        rows, cols = np.nonzero(mask)
+        dates = chunk_days[rows].astype('datetime64[D]')
+        dates[chunk_days[rows] == EMPTY_DAY] = np.datetime64('NaT')
+        yield list(zip(
+            sheet_rows[offset:offset + chunk_rows][rows].tolist(),
+            dates.tolist(),
+            [sector_columns[col] for col in cols.tolist()],
+            opokas[offset:offset + chunk_rows][rows, cols].tolist()
+        ))
+
+
+def repair_rows(events, start=None, end=None):
+    start = str(start) if start is not None else None
+    end = str(end) if end is not None else None
+    return [
+        (opoka, date.fromisoformat(event_date), EVENT_NAMES.get(kind, kind))
+        for opoka, event_date, kind in events
+        if (start is None or event_date >= start) and (end is None or event_date <= end)
+    ]
+
+
+def export_table(path, table, data_cache, history, start=None, end=None,
+                 chunk_rows=50000, cancel_event=None, progress=None):
+    """Выгружает таблицу table в файл path, возвращает количество строк.
+
+    data_cache - DataCache (журнал плавок нужен только для usages), history -
+    история опок. cancel_event (threading.Event) проверяется между частями,
+    progress(процент, текст) сообщает ход выгрузки. Не использует Qt.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if start is not None and end is not None and str(start) > str(end):
+        raise ValueError("Начало периода позже его конца")
+    data_manager = data_cache.data_manager
+
+    if table == 'usages':
+        days, opokas, sheet_rows = data_cache.rows()
+        columns = USAGE_COLUMNS
+        chunks = usage_chunks(days, opokas, sheet_rows, data_manager.fleet.sector_columns,
+                              start, end, chunk_rows)
+        chunk_count = max(-(-len(days) // chunk_rows), 1)
+    elif table == 'repairs':
+        columns = REPAIR_COLUMNS
+        chunks = [repair_rows(data_manager.repair_history(history), start, end)]
+        chunk_count = 1
+    else:
+        rows = statistics_rows(history, data_manager.fleet.opoka_nums)
+        columns = list(rows[0]) if rows else []
+        chunks = [[list(row.values()) for row in rows]]
+        chunk_count = 1
+
+    # Расширение сохраняется, чтобы писатели не меняли формат по имени файла
+    tmp_file = path + '.tmp' + os.path.splitext(path)[1]
+    writer = writer_class(path)(tmp_file, columns)
+    written = 0
+    try:
+        for number, chunk in enumerate(chunks, start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled()
+            writer.write(chunk)
+            written += len(chunk)
+            if progress is not None:
+                progress(min(number * 100 // chunk_count, 100), f"Выгружено строк: {written}")
+        writer.close()
+    except BaseException:
+        writer.abort()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, path)
+    return written
@@ -0,0 +1,1224 @@
+from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, 
+                              QHBoxLayout, QTableView, QLabel, 
+                              QComboBox, QPushButton, QHeaderView, QFrame, QMessageBox, QLineEdit, QGraphicsDropShadowEffect,
+                              QProgressBar, QDialog, QDialogButtonBox, QFormLayout, QDateEdit,
+                              QCheckBox, QFileDialog, QScrollArea)
+from PySide6.QtCore import (Qt, QSize, QPropertyAnimation, QEasingCurve, QTimer, QObject, QRunnable,
+                            QThreadPool, Signal, QFileSystemWatcher, QAbstractTableModel, QModelIndex,
+                            QSortFilterProxyModel, QDate)
+from PySide6.QtGui import QColor, QIcon, QLinearGradient, QPalette
+import numpy as np
+from datetime import datetime
+import calendar
+import copy
+import os
+import threading
+
+from opoka_alerts import ThresholdMonitor, alert_text
+from opoka_api import OpokaApi, start_in_thread
+from opoka_data import (DataCache, HistoryStore, RefreshCancelled, apply_usage_stats,
+                        collect_repair_dates, compute_refresh, create_data_manager,
+                        record_repair)
+from opoka_journal import REPAIR_OUT, REPAIR_RETURN
+from opoka_export import TABLES, WRITERS, export_table
+from opoka_records import FleetConfig, record_state, status_text
+import opoka_timing as timing
+
+class RefreshSignals(QObject):
+    progress = Signal(int, str)
+    finished = Signal(int, object)
+    failed = Signal(int, str)
+
+class RefreshWorker(QRunnable):
+    """Фоновый расчет данных окна; результат передается через сигналы"""
+    def __init__(self, generation, task):
+        super().__init__()
+        self.generation = generation
+        self.task = task
+        self.cancel_event = threading.Event()
+        self.signals = RefreshSignals()
+        
+    def cancel(self):
+        self.cancel_event.set()
+        
+    def run(self):
+        try:
+            result = self.task(self.cancel_event, self.report_progress)
+        except RefreshCancelled:
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.finished.emit(self.generation, result)
+        
+    def report_progress(self, percent, text):
+        self.signals.progress.emit(percent, text)
+
+class DataFileWatcher(QObject):
+    """Следит за файлами данных и сообщает об их изменении с задержкой.
+    
+    Сигнал file_changed приходит, когда файл перестал меняться на время debounce_ms,
+    чтобы не читать наполовину сохраненную книгу. Excel сохраняет файл через
+    удаление и создание заново, поэтому отслеживаются и каталоги файлов, а
+    пропавший из наблюдения файл добавляется снова. Дополнительно файлы
+    опрашиваются по таймеру на случай, если системные уведомления не работают.
+    """
+    file_changed = Signal(str)
+    
+    def __init__(self, paths, debounce_ms=1500, poll_ms=5000, parent=None):
+        super().__init__(parent)
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.stats = {path: self.file_stat(path) for path in self.paths}
+        self.pending = set()
+        
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_event)
+        self.watcher.directoryChanged.connect(self.on_directory_event)
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            self.watcher.addPath(directory)
+        self.watch_files()
+        
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.timeout.connect(self.emit_pending)
+        
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(poll_ms)
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start()
+        
+    @staticmethod
+    def file_stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+        
+    def watch_files(self):
+        watched = set(self.watcher.files())
+        for path in self.paths:
+            if path not in watched and os.path.exists(path):
+                self.watcher.addPath(path)
+        
+    def on_file_event(self, path):
+        # После удаления и создания файла наблюдение нужно восстановить
+        self.watch_files()
+        self.pending.add(path)
+        self.debounce_timer.start()
+        
+    def on_directory_event(self, directory):
+        for path in self.paths:
+            if os.path.dirname(path) == directory and self.file_stat(path) != self.stats[path]:
+                self.on_file_event(path)
+        
+    def poll(self):
+        for path in self.paths:
+            if path not in self.pending and self.file_stat(path) != self.stats[path]:
+                self.on_file_event(path)
+        
+    def emit_pending(self):
+        for path in sorted(self.pending):
+            stat = self.file_stat(path)
+            if stat is None or stat[1] == 0:
+                # Файл еще не записан до конца, ждем следующей проверки
+                self.debounce_timer.start()
+                continue
+            self.pending.discard(path)
+            if stat != self.stats[path]:
+                self.stats[path] = stat
+                self.file_changed.emit(path)
+
+# Цвета ячеек таблицы по дневной нагрузке
+HIGH_LOAD_COLOR = QColor("#FFE0B2")  # Оранжевый
+USED_COLOR = QColor("#C8E6C9")  # Зеленый
+
+class UsageGridModel(QAbstractTableModel):
+    """Модель таблицы использований опок по дням над матрицей счетчиков.
+    
+    Первая колонка - номер опоки, далее 31 колонка дней месяца. При обновлении
+    матрицы того же размера сигнал dataChanged отправляется только для
+    изменившихся ячеек каждой строки.
+    """
+    DAY_COLUMNS = 31
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.opoka_nums = []
+        self.grid = np.zeros((0, self.DAY_COLUMNS), dtype=np.int64)
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.opoka_nums)
+        
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.DAY_COLUMNS + 1
+        
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return 'Опока' if section == 0 else str(section)
+        return super().headerData(section, orientation, role)
+        
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        
+        if col == 0:
+            return f"№{self.opoka_nums[row]}" if role == Qt.DisplayRole else None
+        
+        count = int(self.grid[row, col - 1]) if col <= self.grid.shape[1] else 0
+        if role == Qt.DisplayRole:
+            return str(count) if count > 0 else ""
+        if role == Qt.BackgroundRole:
+            if count > 3:  # Высокая нагрузка в день
+                return HIGH_LOAD_COLOR
+            elif count > 0:
+                return USED_COLOR
+        return None
+        
+    def set_grid(self, opoka_nums, grid):
+        opoka_nums = list(opoka_nums)
+        if opoka_nums != self.opoka_nums or grid.shape != self.grid.shape:
+            self.beginResetModel()
+            self.opoka_nums = opoka_nums
+            self.grid = grid.copy()
+            self.endResetModel()
+            return
+        
+        changed = grid != self.grid
+        self.grid = grid.copy()
+        for row in np.flatnonzero(changed.any(axis=1)):
+            changed_cols = np.flatnonzero(changed[row])
+            self.dataChanged.emit(
+                self.index(int(row), int(changed_cols[0]) + 1),
+                self.index(int(row), int(changed_cols[-1]) + 1),
+                [Qt.DisplayRole, Qt.BackgroundRole]
+            )
+
+# Общие стили приложения. Таблица задается один раз для QApplication, виджеты
+# выбираются по objectName, состояние - динамическими свойствами. Правила
+# вложенных виджетов идут после правил контейнеров, чтобы при равной
+# специфичности побеждали они.
+APP_STYLESHEET = """
+    QLabel#headerLabel {
+        font-size: 12px;
+    }
+    QPushButton#actionButton {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #2196F3, stop: 1 #1976D2
+        );
+        color: white;
+        border-radius: 4px;
+        padding: 5px 10px;
+        font-size: 11px;
+        border: none;
+    }
+    QPushButton#actionButton:hover {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #1E88E5, stop: 1 #1565C0
+        );
+    }
+    QPushButton#actionButton:pressed {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #1565C0, stop: 1 #0D47A1
+        );
+        padding: 6px 9px 4px 11px;
+    }
+    QFrame#headerLine {
+        border: none;
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 1, y2: 0,
+            stop: 0 #E0E0E0, stop: 0.5 #9E9E9E, stop: 1 #E0E0E0
+        );
+        height: 1px;
+    }
+    QComboBox#monthDropdown, QLineEdit#searchInput {
+        border: 1px solid #BDBDBD;
+        border-radius: 4px;
+        padding: 3px;
+        background-color: white;
+        font-size: 11px;
+    }
+    QComboBox#monthDropdown:hover, QLineEdit#searchInput:hover {
+        border: 1px solid #2196F3;
+    }
+    QComboBox#monthDropdown::drop-down {
+        border: none;
+        padding-right: 5px;
+    }
+    QComboBox#monthDropdown::down-arrow {
+        image: url(down_arrow.png);
+        width: 12px;
+        height: 12px;
+    }
+    QTableView#usageTable {
+        border: 1px solid #BDBDBD;
+        border-radius: 8px;
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #FFFFFF, stop: 1 #F5F5F5
+        );
+    }
+    QTableView#usageTable::item {
+        padding: 2px;
+        font-size: 11px;
+    }
+    QTableView#usageTable::item:hover {
+        background: rgba(33, 150, 243, 0.1);
+    }
+    QTableView#usageTable QHeaderView::section {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #F5F5F5, stop: 1 #E0E0E0
+        );
+        padding: 2px;
+        font-size: 11px;
+        border: 1px solid #BDBDBD;
+    }
+    QWidget#statsRow {
+        background-color: #FFFFFF;
+        border-radius: 3px;
+        margin: 1px;
+        padding: 2px;
+    }
+    QWidget#statsRow[state="repair"] {
+        background-color: #BDBDBD;
+    }
+    QWidget#statsRow[state="idle"] {
+        background-color: #E3F2FD;
+    }
+    QWidget#statsRow[state="critical"] {
+        background-color: #FFCDD2;
+    }
+    QWidget#statsRow[state="warning"] {
+        background-color: #FFF9C4;
+    }
+    QWidget#statsRow QLabel {
+        font-size: 11px;
+        border-radius: 3px;
+        margin: 1px;
+        padding: 2px;
+    }
+    QWidget#statsRow QLabel[critical="true"] {
+        color: red;
+        font-weight: bold;
+    }
+    QPushButton#repairButton {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #F5F5F5, stop: 1 #E0E0E0
+        );
+        border: 1px solid #BDBDBD;
+        border-radius: 4px;
+    }
+    QPushButton#repairButton:hover {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #E0E0E0, stop: 1 #BDBDBD
+        );
+    }
+    QPushButton#repairButton:pressed {
+        padding: 2px -2px -2px 2px;
+    }
+    QFrame#statsWidget, QFrame#statsWidget QFrame {
+        background: qlineargradient(
+            x1: 0, y1: 0, x2: 0, y2: 1,
+            stop: 0 #FFFFFF, stop: 1 #F5F5F5
+        );
+        border: 1px solid #BDBDBD;
+        border-radius: 8px;
+    }
+    QFrame#statsWidget QLabel {
+        font-size: 11px;
+        background: transparent;
+    }
+    QFrame#statsWidget QLabel[header="true"] {
+        font-weight: bold;
+        color: #1976D2;
+    }
+    QFrame#statsWidget QLabel#statsHeader {
+        font-weight: bold;
+        font-size: 11px;
+    }
+    QFrame#statsWidget QScrollArea#statsScroll, QWidget#statsRows {
+        background: transparent;
+        border: none;
+    }
+    QWidget#statsColumns, QWidget#statsColumns QLabel {
+        background-color: #CFD8DC;
+        border-radius: 3px;
+    }
+    QWidget#monthlyStats, QWidget#monthlyStats QWidget {
+        background-color: #F5F5F5;
+        border-radius: 5px;
+        padding: 5px;
+    }
+    QWidget#monthlyStats QLabel {
+        font-size: 11px;
+    }
+    QWidget#monthlyStats QLabel#monthlyStatsHeader {
+        font-weight: bold;
+        font-size: 11px;
+        color: #1976D2;
+        padding-bottom: 5px;
+    }
+    QWidget#monthlyStats QLabel#monthlyStatsText {
+        background-color: white;
+        padding: 8px;
+        border-radius: 4px;
+        font-size: 11px;
+        line-height: 1.4;
+    }
+    QFrame#alertBanner {
+        background-color: #FFF3E0;
+        border: 1px solid #FFB74D;
+        border-radius: 4px;
+    }
+    QLabel#alertText {
+        font-size: 11px;
+        color: #E65100;
+    }
+    QLabel#statusLabel {
+        font-size: 11px;
+        color: #455A64;
+    }
+    QLabel#statusLabel[error="true"] {
+        color: #C62828;
+    }
+"""
+
+def set_style_property(widget, name, value):
+    """Меняет динамическое свойство виджета и переприменяет к нему стиль"""
+    if widget.property(name) == value:
+        return
+    widget.setProperty(name, value)
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)
+
+class OpokaStatsRow(QWidget):
+    """Строка панели статистики опоки. Создается один раз, при обновлении
+    меняются только изменившиеся тексты и свойства стиля."""
+    WIDTHS = [25, 35, 40, 35, 50]
+    
+    def __init__(self, opoka_num, on_repair_clicked, parent=None):
+        super().__init__(parent)
+        self.setObjectName("statsRow")
+        self.setAttribute(Qt.WA_StyledBackground, True)
+        
+        layout = QHBoxLayout(self)
+        layout.setSpacing(2)
+        
+        self.labels = []
+        for width in self.WIDTHS:
+            label = QLabel()
+            label.setFixedWidth(width)
+            layout.addWidget(label)
+            self.labels.append(label)
+        self.labels[0].setText(str(opoka_num))
+        
+        # Добавляем кнопку ремонта
+        self.repair_button = QPushButton()
+        self.repair_button.setObjectName("repairButton")
+        self.repair_button.setFixedSize(QSize(30, 30))
+        self.repair_button.clicked.connect(lambda: on_repair_clicked(opoka_num))
+        layout.addWidget(self.repair_button)
+        
+    def set_data(self, texts, state, critical, in_repair, tooltip):
+        for label, text in zip(self.labels[1:], texts):
+            if label.text() != text:
+                label.setText(text)
+        
+        set_style_property(self, "state", state)
+        set_style_property(self.labels[1], "critical", critical)
+        
+        button_text = "🔧" if not in_repair else "↩"
+        if self.repair_button.text() != button_text:
+            self.repair_button.setText(button_text)
+        if self.toolTip() != tooltip:
+            self.setToolTip(tooltip)
+
+class ExportDialog(QDialog):
+    """Выбор таблицы, периода и файла для экспорта"""
+    FILE_FILTERS = {
+        '.xlsx': "Книга Excel (*.xlsx)",
+        '.csv': "CSV (*.csv)",
+        '.parquet': "Parquet (*.parquet)",
+    }
+    
+    def __init__(self, first_date, last_date, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Экспорт")
+        
+        layout = QFormLayout(self)
+        
+        self.table_combo = QComboBox()
+        for table, title in TABLES.items():
+            self.table_combo.addItem(title, table)
+        self.table_combo.currentIndexChanged.connect(self.on_table_changed)
+        layout.addRow("Таблица:", self.table_combo)
+        
+        self.whole_period = QCheckBox("Весь журнал")
+        self.whole_period.setChecked(True)
+        self.whole_period.toggled.connect(self.on_table_changed)
+        layout.addRow("Период:", self.whole_period)
+        
+        self.date_from = QDateEdit(QDate(first_date.year, first_date.month, first_date.day))
+        self.date_to = QDateEdit(QDate(last_date.year, last_date.month, last_date.day))
+        for date_edit in (self.date_from, self.date_to):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("dd.MM.yyyy")
+        layout.addRow("С:", self.date_from)
+        layout.addRow("По:", self.date_to)
+        
+        path_row = QWidget()
+        path_layout = QHBoxLayout(path_row)
+        path_layout.setContentsMargins(0, 0, 0, 0)
+        self.path_input = QLineEdit(os.path.abspath('статистика_опок.xlsx'))
+        self.path_input.setMinimumWidth(300)
+        browse_button = QPushButton("Обзор...")
+        browse_button.clicked.connect(self.choose_path)
+        path_layout.addWidget(self.path_input)
+        path_layout.addWidget(browse_button)
+        layout.addRow("Файл:", path_row)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.validate)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+        
+        self.on_table_changed()
+        
+    def on_table_changed(self):
+        # Сводка по опокам от периода не зависит
+        dated = self.table_combo.currentData() != 'statistics'
+        self.whole_period.setEnabled(dated)
+        period = dated and not self.whole_period.isChecked()
+        self.date_from.setEnabled(period)
+        self.date_to.setEnabled(period)
+        
+    def choose_path(self):
+        filters = ";;".join(self.FILE_FILTERS[ext] for ext in WRITERS)
+        extension = os.path.splitext(self.path_input.text())[1].lower()
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт", self.path_input.text(), filters,
+            self.FILE_FILTERS.get(extension, "")
+        )
+        if path:
+            self.path_input.setText(path)
+        
+    def validate(self):
+        extension = os.path.splitext(self.path_input.text())[1].lower()
+        if extension not in WRITERS:
+            QMessageBox.warning(self, "Экспорт", "Файл должен иметь расширение "
+                                + ", ".join(WRITERS))
+            return
+        if self.date_from.isEnabled() and self.date_from.date() > self.date_to.date():
+            QMessageBox.warning(self, "Экспорт", "Начало периода позже его конца")
+            return
+        self.accept()
+        
+    def values(self):
+        """(таблица, файл, начало периода, конец периода); без периода - None"""
+        start = end = None
+        if self.date_from.isEnabled():
+            start = self.date_from.date().toPython()
+            end = self.date_to.date().toPython()
+        return self.table_combo.currentData(), self.path_input.text(), start, end
+
+class MainWindow(QMainWindow):
+    # Окно отрисовано в первый раз; загрузка журнала начинается после этого
+    first_painted = Signal()
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Учет использования опок")
+        self.setFixedSize(1370, 850)
+        
+        self.current_date = datetime.now()
+        # Состав парка опок, колонки секторов и пороги берутся из fleet_config.json
+        self.fleet = FleetConfig.load()
+        self.opoka_data_manager = create_data_manager(fleet=self.fleet)
+        self.data_cache = DataCache(self.opoka_data_manager)
+        
+        # История опок держится в памяти и сохраняется с задержкой
+        self.history_store = HistoryStore(self.opoka_data_manager)
+        self.history_flush_timer = QTimer(self)
+        self.history_flush_timer.setSingleShot(True)
+        self.history_flush_timer.setInterval(1000)
+        self.history_flush_timer.timeout.connect(self.history_store.flush)
+        self.history_store.on_dirty = self.history_flush_timer.start
+        
+        # Переходы счетчиков через пороги копятся до просмотра и показываются
+        # одной панелью без модальных окон
+        self.threshold_monitor = ThresholdMonitor(self.fleet)
+        self.pending_alerts = {}
+        
+        # Загрузка и расчеты выполняются в одном фоновом потоке, в окно
+        # попадает только результат последнего запроса
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.refresh_generation = 0
+        self.refresh_worker = None
+        
+        # Экспорт идет в своем потоке, чтобы длинная выгрузка не задерживала
+        # обновление окна
+        self.export_pool = QThreadPool(self)
+        self.export_pool.setMaxThreadCount(1)
+        self.export_worker = None
+        
+        # Создаем верхнюю панель с двумя строками
+        header_widget = QWidget()
+        header_layout = QVBoxLayout(header_widget)
+        header_layout.setSpacing(5)
+        
+        # Первая строка верхней панели
+        top_row = QWidget()
+        top_layout = QHBoxLayout(top_row)
+        top_layout.setContentsMargins(0, 0, 0, 0)
+        
+        # Добавляем дату и кнопки
+        date_label = QLabel(f"Дата: {self.current_date.strftime('%d.%m.%Y')}")
+        date_label.setObjectName("headerLabel")
+        
+        self.recalc_button = QPushButton("Пересчитать историю")
+        self.recalc_button.setObjectName("actionButton")
+        self.recalc_button.clicked.connect(self.recalculate_and_update)
+        
+        self.export_button = QPushButton("Экспорт статистики")
+        self.export_button.setObjectName("actionButton")
+        self.export_button.clicked.connect(self.export_statistics)
+        
+        # Добавляем иконки к кнопкам
+        self.recalc_button.setIcon(QIcon("icons/refresh.png"))  # Нужно добавить иконки
+        self.recalc_button.setIconSize(QSize(16, 16))
+        self.export_button.setIcon(QIcon("icons/export.png"))
+        self.export_button.setIconSize(QSize(16, 16))
+        
+        # Индикатор фоновой загрузки
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFixedWidth(200)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.hide()
+        
+        # Добавляем разделители
+        line = QFrame()
+        line.setFrameShape(QFrame.HLine)
+        line.setFrameShadow(QFrame.Sunken)
+        line.setObjectName("headerLine")
+        
+        # Добавляем разделитель после верхней панели
+        header_layout.addWidget(line)
+        
+        top_layout.addWidget(date_label)
+        top_layout.addWidget(self.recalc_button)
+        top_layout.addWidget(self.export_button)
+        top_layout.addWidget(self.progress_bar)
+        top_layout.addStretch()
+        
+        # Вторая строка верхней панели
+        bottom_row = QWidget()
+        bottom_layout = QHBoxLayout(bottom_row)
+        bottom_layout.setContentsMargins(0, 0, 0, 0)
+        
+        # Добавляем выбор месяца и поиск
+        month_label = QLabel("Месяц:")
+        month_label.setObjectName("headerLabel")
+        
+        self.month_dropdown = QComboBox()
+        self.month_dropdown.setObjectName("monthDropdown")
+        self.month_dropdown.setFixedWidth(200)
+        self.setup_month_dropdown()
+        
+        # Добавляем поиск
+        search_widget = self.add_search_widget()
+        
+        bottom_layout.addWidget(month_label)
+        bottom_layout.addWidget(self.month_dropdown)
+        bottom_layout.addSpacing(20)
+        bottom_layout.addWidget(search_widget)
+        bottom_layout.addStretch()
+        
+        # Добавляем строки в верхнюю панель
+        header_layout.addWidget(top_row)
+        header_layout.addWidget(bottom_row)
+        
+        # Создаем основной контейнер
+        main_container = QWidget()
+        main_layout = QVBoxLayout(main_container)
+        main_layout.setSpacing(10)
+        main_layout.setContentsMargins(10, 10, 10, 10)
+        
+        # Добавляем верхнюю панель
+        main_layout.addWidget(header_widget)
+        
+        # Создаем контейнер для таблицы и правой панели
+        content_container = QWidget()
+        content_layout = QHBoxLayout(content_container)
+        content_layout.setSpacing(10)
+        content_layout.setContentsMargins(0, 0, 0, 0)
+        
+        # Добавляем таблицу
+        table_container = QWidget()
+        table_layout = QVBoxLayout(table_container)
+        table_layout.setContentsMargins(0, 0, 0, 0)
+        
+        # Панель оповещений о порогах над таблицей, скрыта, пока их нет
+        self.alert_banner = QFrame()
+        self.alert_banner.setObjectName("alertBanner")
+        alert_layout = QHBoxLayout(self.alert_banner)
+        alert_layout.setContentsMargins(8, 4, 8, 4)
+        self.alert_label = QLabel()
+        self.alert_label.setObjectName("alertText")
+        self.alert_label.setWordWrap(True)
+        alert_layout.addWidget(self.alert_label, 1)
+        alert_dismiss_button = QPushButton("Скрыть")
+        alert_dismiss_button.setObjectName("actionButton")
+        alert_dismiss_button.clicked.connect(self.dismiss_alerts)
+        alert_layout.addWidget(alert_dismiss_button)
+        self.alert_banner.hide()
+        table_layout.addWidget(self.alert_banner)
+        
+        # Таблица использований: модель над матрицей и фильтр для поиска
+        self.grid_model = UsageGridModel(self)
+        self.grid_proxy = QSortFilterProxyModel(self)
+        self.grid_proxy.setSourceModel(self.grid_model)
+        self.grid_proxy.setFilterKeyColumn(0)
+        
+        self.table = QTableView()
+        self.table.setObjectName("usageTable")
+        self.table.setModel(self.grid_proxy)
+        self.table.horizontalHeader().setDefaultSectionSize(28)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
+        self.table.horizontalHeader().resizeSection(0, 45)
+        table_layout.addWidget(self.table)
+        
+        # Создаем правую панель
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+        right_layout.setSpacing(10)
+        right_layout.setContentsMargins(10, 10, 10, 10)
+        
+        # Добавляем статистику использования
+        self.stats_widget = QFrame()
+        self.stats_widget.setObjectName("statsWidget")
+        # Ширина с местом под полосу прокрутки строк опок
+        self.stats_widget.setFixedWidth(270)
+        self.stats_widget.setFrameStyle(QFrame.Box | QFrame.Raised)
+        self.stats_layout = QVBoxLayout(self.stats_widget)
+        self.stats_rows = {}
+        
+        # Добавляем месячную статистику
+        monthly_stats = self.add_monthly_stats()
+        
+        right_layout.addWidget(self.stats_widget)
+        right_layout.addWidget(monthly_stats)
+        
+        # Добавляем компоненты в content_layout
+        content_layout.addWidget(table_container, stretch=4)
+        content_layout.addWidget(right_panel)
+        
+        # Добавляем все в главный layout
+        main_layout.addWidget(content_container)
+        
+        # Устанавливаем главный контейнер
+        self.setCentralWidget(main_container)
+        
+        # Строка состояния: разбивка времени последнего обновления и ошибки
+        self.status_label = QLabel()
+        self.status_label.setObjectName("statusLabel")
+        self.statusBar().addWidget(self.status_label, 1)
+        
+        # Добавляем тени
+        self.add_shadow(self.stats_widget)
+        self.add_shadow(self.table)
+        
+        # Окно сразу показывает последнее сохраненное состояние опок из истории,
+        # журнал плавок загружается после первой отрисовки (paintEvent)
+        self.first_paint_done = False
+        self.initial_load_timer = QTimer(self)
+        self.initial_load_timer.setSingleShot(True)
+        self.initial_load_timer.setInterval(0)
+        self.initial_load_timer.timeout.connect(self.start_initial_load)
+        self.update_statistics()
+        self.show_status("Загрузка журнала плавок...")
+        
+        # Обновляем данные автоматически при изменении файлов
+        self.file_watcher = DataFileWatcher(self.opoka_data_manager.watched_files(), parent=self)
+        self.file_watcher.file_changed.connect(self.on_data_file_changed)
+        
+        # Локальный API для панели цеха отдает те же данные, что видит окно
+        self.api_server = None
+        api_port = os.environ.get('OPOKA_API_PORT')
+        if api_port:
+            api = OpokaApi(self.data_cache, self.history_store, self.fleet, reload_history=False)
+            self.api_server = start_in_thread(api, port=int(api_port))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            self.initial_load_timer.start()
+            self.first_painted.emit()
+
+    def start_initial_load(self):
+        """Первая загрузка данных после того, как окно уже показано"""
+        self.opoka_data_manager.migrate_repairs(self.history_store.get())
+        self.update_table(self.current_date)
+
+    def closeEvent(self, event):
+        # Сохраняем отложенные изменения истории перед закрытием окна
+        self.history_flush_timer.stop()
+        self.history_store.flush()
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+        if self.api_server is not None:
+            self.api_server.shutdown()
+        super().closeEvent(event)
+
+    def setup_month_dropdown(self):
+        # До загрузки журнала в списке только текущий месяц, остальные месяцы
+        # добавляются после первого расчета
+        self.fill_month_dropdown([])
+        self.month_dropdown.currentIndexChanged.connect(self.on_month_changed)
+
+    def fill_month_dropdown(self, months):
+        """Заполняет список всеми месяцами журнала и текущим месяцем,
+        сохраняя выбранный месяц"""
+        months = sorted(set(months) | {(self.current_date.year, self.current_date.month)})
+        items = [f"{year}-{month:02d}" for year, month in months]
+        if items == [self.month_dropdown.itemData(i) for i in range(self.month_dropdown.count())]:
+            return
+        
+        selected = self.month_dropdown.currentData() or items[-1]
+        self.month_dropdown.blockSignals(True)
+        self.month_dropdown.clear()
+        for (year, month), month_str in zip(months, items):
+            self.month_dropdown.addItem(f"{calendar.month_name[month]} {year}", month_str)
+        self.month_dropdown.setCurrentIndex(max(self.month_dropdown.findData(selected), 0))
+        self.month_dropdown.blockSignals(False)
+
+    def on_month_changed(self):
+        selected_date = datetime.strptime(
+            self.month_dropdown.currentData(), 
+            '%Y-%m'
+        )
+        if self.refresh_worker is not None or not self.data_cache.loaded:
+            self.update_table(selected_date)
+            return
+        
+        # Счетчики от месяца не зависят: таблица месяца берется из куба
+        # использований уже загруженных данных без фонового расчета
+        trace = timing.Trace('month_switch')
+        with timing.activate(trace), timing.span('render_table'):
+            month_grid = self.data_cache.month_grid(
+                selected_date.year, selected_date.month, self.fleet.opoka_nums,
+                check_file=False
+            )
+            self.paint_month_grid(month_grid, selected_date)
+        trace.finish()
+
+    def on_data_file_changed(self, path):
+        repair_journal = self.opoka_data_manager.repair_journal
+        if path == os.path.abspath(self.opoka_data_manager.excel_file):
+            # Журнал дочитывается инкрементально, таблица перерисует только изменения
+            self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
+        elif path == os.path.abspath(repair_journal.path):
+            # Свои события уже учтены, пересчет нужен только для записанных извне
+            if repair_journal.has_unread_events():
+                self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
+        elif self.history_store.reload_if_changed():
+            self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
+
+    def update_table(self, selected_date, recalculate=False):
+        """Запускает фоновый расчет данных за месяц и обновляет окно по готовности.
+        recalculate - проиграть журнал ремонтов целиком, а не со снимка"""
+        repair_journal = self.opoka_data_manager.repair_journal
+        
+        # Время этапов расчета и отрисовки собирается в одну трассу
+        trace = timing.Trace('refresh')
+        
+        def task(cancel_event, progress):
+            with timing.activate(trace):
+                if recalculate:
+                    with timing.span('replay'):
+                        repair_journal.rebuild()
+                # Состояние ремонтов: снимок и события после него
+                repairs = self.opoka_data_manager.load_repairs()
+                result = compute_refresh(
+                    self.data_cache, collect_repair_dates(repairs, self.fleet.opoka_nums),
+                    selected_date.year, selected_date.month,
+                    self.fleet.opoka_nums, cancel_event, progress
+                )
+                result["repairs"] = repairs
+                result["repair_errors"] = len(repair_journal.skipped)
+                return result
+        
+        # Отменяем предыдущий расчет, его результат уже не нужен
+        if self.refresh_worker is not None:
+            self.refresh_worker.cancel()
+        
+        self.refresh_generation += 1
+        worker = RefreshWorker(self.refresh_generation, task)
+        worker.signals.progress.connect(self.on_refresh_progress)
+        worker.signals.finished.connect(
+            lambda generation, result: self.on_refresh_finished(
+                generation, result, selected_date, trace
+            )
+        )
+        worker.signals.failed.connect(
+            lambda generation, message: self.on_refresh_failed(generation, message, trace)
+        )
+        self.refresh_worker = worker
+        
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.thread_pool.start(worker)
+
+    def on_refresh_progress(self, percent, text):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{text} %p%")
+
+    def on_refresh_failed(self, generation, message, trace):
+        if generation != self.refresh_generation:
+            return
+        self.refresh_worker = None
+        self.progress_bar.hide()
+        trace.finish(error=message)
+        print(f"Ошибка при обновлении данных: {message}")
+        self.show_status(f"Ошибка при обновлении данных: {message}", error=True)
+
+    def on_refresh_finished(self, generation, result, selected_date, trace):
+        # Результаты устаревших запросов не отображаем
+        if generation != self.refresh_generation:
+            return
+        self.refresh_worker = None
+        self.progress_bar.hide()
+        self.apply_refresh(result, selected_date, trace)
+
+    def apply_refresh(self, result, selected_date, trace):
+        try:
+            with timing.activate(trace):
+                usage_stats = result["usage_stats"]
+                
+                # Обновляем счетчики, ремонты и последнее использование
+                apply_usage_stats(
+                    self.history_store, usage_stats, result["repairs"],
+                    self.fleet.opoka_nums, self.fleet.repair_limit
+                )
+                
+                # Новые переходы через пороги добавляются в панель оповещений
+                self.add_alerts(self.threshold_monitor.process(
+                    self.history_store.get(), self.fleet.opoka_nums
+                ))
+                
+                # Обновляем таблицу и список месяцев
+                with timing.span('render_table'):
+                    self.paint_month_grid(result["month_grid"], selected_date)
+                    self.fill_month_dropdown(result["months"])
+                
+                # Обновляем статистику
+                with timing.span('render_stats'):
+                    self.update_statistics()
+            
+        except Exception as e:
+            trace.finish(error=str(e))
+            self.show_status(f"Ошибка: {str(e)}", error=True)
+            return
+        
+        trace.finish()
+        status = (
+            f"Обновлено в {datetime.now().strftime('%H:%M:%S')} за {trace.total_ms:.0f} мс: "
+            f"{trace.summary()}"
+        )
+        if result["quarantine"]:
+            # Строки с ошибками не прерывают загрузку, но о них нужно знать
+            status += (f". Ячеек журнала с ошибками: {result['quarantine']}, "
+                       f"отчет в {self.opoka_data_manager.quarantine_file}")
+        if result["repair_errors"]:
+            status += (f". Поврежденных строк журнала ремонтов: {result['repair_errors']}, "
+                       f"они пропущены ({self.opoka_data_manager.repair_journal.path})")
+        self.show_status(status, error=bool(result["quarantine"] or result["repair_errors"]))
+
+    def add_alerts(self, alerts):
+        for alert in alerts:
+            self.pending_alerts[alert.opoka] = alert
+        if alerts:
+            self.update_alert_banner()
+
+    def update_alert_banner(self):
+        if not self.pending_alerts:
+            self.alert_banner.hide()
+            return
+        lines = [alert_text(alert, self.fleet)
+                 for _, alert in sorted(self.pending_alerts.items())]
+        self.alert_label.setText("Требуют внимания:\n" + "\n".join(lines))
+        self.alert_banner.show()
+
+    def dismiss_alerts(self):
+        self.pending_alerts.clear()
+        self.update_alert_banner()
+
+    def show_status(self, text, error=False):
+        """Показывает сообщение в строке состояния; ошибки выделяются красным"""
+        self.status_label.setText(text)
+        set_style_property(self.status_label, "error", error)
+
+    def paint_month_grid(self, month_grid, selected_date):
+        """Передает матрицу использований месяца модели таблицы"""
+        self.grid_model.set_grid(self.fleet.opoka_nums, month_grid)
+
+    def get_row_state(self, opoka_data):
+        """Определяет состояние строки статистики по текущему количеству использований.
+        Цвет состояния задается в APP_STYLESHEET."""
+        return record_state(opoka_data, self.fleet)
+
+    def build_statistics(self):
+        """Создает панель статистики один раз; дальше строки обновляются на месте"""
+        # Добавляем заголовок
+        header = QLabel("Статистика использования:")
+        header.setObjectName("statsHeader")
+        self.stats_layout.addWidget(header)
+        
+        # Создаем заголовок таблицы статистики
+        header_widget = QWidget()
+        header_widget.setObjectName("statsColumns")
+        header_layout = QHBoxLayout(header_widget)
+        header_layout.setSpacing(2)
+        
+        headers = ["№", "Тек.", "Всего", "Рем.", "Статус"]
+        for header_text, width in zip(headers, OpokaStatsRow.WIDTHS):
+            label = QLabel(header_text)
+            label.setFixedWidth(width)
+            header_layout.addWidget(label)
+        self.stats_layout.addWidget(header_widget)
+        
+        # Строки опок прокручиваются под заголовком: при большом парке
+        # они не сжимаются до нулевой высоты
+        rows_widget = QWidget()
+        rows_widget.setObjectName("statsRows")
+        rows_layout = QVBoxLayout(rows_widget)
+        rows_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.stats_rows = {}
+        for i in self.fleet.opoka_nums:
+            row_widget = OpokaStatsRow(i, self.toggle_repair)
+            
+            # Добавляем анимацию при наведении на строку статистики
+            self.add_hover_animation(row_widget)
+            
+            rows_layout.addWidget(row_widget)
+            self.stats_rows[i] = row_widget
+        rows_layout.addStretch()
+        
+        scroll_area = QScrollArea()
+        scroll_area.setObjectName("statsScroll")
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        scroll_area.setFrameShape(QFrame.NoFrame)
+        scroll_area.setWidget(rows_widget)
+        scroll_area.viewport().setAutoFillBackground(False)
+        self.stats_layout.addWidget(scroll_area, 1)
+
+    def update_statistics(self):
+        if not self.stats_rows:
+            self.build_statistics()
+        
+        usage_history = self.history_store.get()
+        
+        for i, row_widget in self.stats_rows.items():
+            opoka_data = usage_history[i]
+            
+            # Создаем детальную подсказку
+            tooltip_text = (
+                f"Опока №{i}\n"
+                f"Текущих использований: {opoka_data.count}\n"
+                f"Всего использований: {opoka_data.total_count}\n"
+                f"Количество ремонтов: {opoka_data.repair_count}\n"
+                f"Последний ремонт: {opoka_data.last_repair_date or 'Не было'}\n"
+                f"Последнее использование: {opoka_data.last_use or 'Не использовалась'}"
+            )
+            
+            row_widget.set_data(
+                [
+                    str(opoka_data.count),
+                    str(opoka_data.total_count),
+                    str(opoka_data.repair_count),
+                    self.get_status_text(opoka_data)
+                ],
+                state=self.get_row_state(opoka_data),
+                # Красным выделяется только поле "Тек." если count >= 91
+                critical=int(opoka_data.count) >= self.fleet.critical_threshold,
+                in_repair=bool(opoka_data.in_repair),
+                tooltip=tooltip_text
+            )
+
+    def get_status_text(self, opoka_data):
+        return status_text(opoka_data)
+
+    def get_status_color(self, opoka_data):
+        if opoka_data.in_repair:
+            return "#BDBDBD"  # Серый
+        elif opoka_data.auto_reset:
+            return "#E3F2FD"  # Голубой
+        elif opoka_data.count >= self.fleet.repair_limit:
+            return "#FFCDD2"  # Красный
+        return "#C8E6C9"  # Зеленый
+
+    def toggle_repair(self, opoka_num):
+        usage_history = self.history_store.get()
+        if usage_history[opoka_num].in_repair:
+            self.return_from_repair(opoka_num)
+        else:
+            self.send_to_repair(opoka_num)
+
+    def send_to_repair(self, opoka_num):
+        reply = QMessageBox.question(
+            self,
+            'Подтверждение',
+            f'Отправить опоку №{opoka_num} в ремонт?',
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        
+        if reply == QMessageBox.Yes:
+            # Счетчик сбрасывается: дальше он считается от даты ремонта
+            record_repair(self.opoka_data_manager, self.history_store, REPAIR_OUT,
+                          opoka_num, datetime.now().strftime('%Y-%m-%d'))
+            if self.pending_alerts.pop(opoka_num, None) is not None:
+                self.update_alert_banner()
+            self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
+
+    def return_from_repair(self, opoka_num):
+        record_repair(self.opoka_data_manager, self.history_store, REPAIR_RETURN,
+                      opoka_num, datetime.now().strftime('%Y-%m-%d'))
+        self.update_table(datetime.strptime(self.month_dropdown.currentData(), '%Y-%m'))
+
+    def recalculate_and_update(self):
+        self.update_table(self.current_date, recalculate=True)
+
+    def export_statistics(self):
+        months = [
+            datetime.strptime(self.month_dropdown.itemData(i), '%Y-%m')
+            for i in range(self.month_dropdown.count())
+        ]
+        dialog = ExportDialog(min(months), self.current_date, self)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        table, path, start, end = dialog.values()
+        
+        # Фоновый поток получает копию истории, окно может менять ее дальше
+        history = {key: copy.copy(record) for key, record in self.history_store.get().items()}
+        
+        def task(cancel_event, progress):
+            return export_table(path, table, self.data_cache, history, start, end,
+                                cancel_event=cancel_event, progress=progress)
+        
+        worker = RefreshWorker(0, task)
+        worker.signals.progress.connect(
+            lambda percent, text: self.show_status(f"Экспорт: {percent}% ({text})")
+        )
+        worker.signals.finished.connect(
+            lambda _, written: self.on_export_finished(path, written)
+        )
+        worker.signals.failed.connect(lambda _, message: self.on_export_failed(message))
+        self.export_worker = worker
+        self.export_button.setEnabled(False)
+        self.show_status(f"Экспорт в файл \"{path}\"...")
+        self.export_pool.start(worker)
+
+    def on_export_finished(self, path, written):
+        self.export_worker = None
+        self.export_button.setEnabled(True)
+        self.show_status(f"Экспортировано строк: {written} в файл \"{path}\"")
+
+    def on_export_failed(self, message):
+        worker, self.export_worker = self.export_worker, None
+        self.export_button.setEnabled(True)
+        if worker is not None and worker.cancel_event.is_set():
+            return
+        self.show_status(f"Не удалось выполнить экспорт: {message}", error=True)
+
+    def add_search_widget(self):
+        search_widget = QWidget()
+        search_layout = QHBoxLayout(search_widget)
+        search_layout.setContentsMargins(0, 0, 0, 0)
+        
+        search_label = QLabel("Поиск опоки:")
+        search_label.setObjectName("headerLabel")
+        
+        self.search_input = QLineEdit()
+        self.search_input.setObjectName("searchInput")
+        self.search_input.setPlaceholderText("Введите номер опоки...")
+        self.search_input.setFixedWidth(150)
+        self.search_input.textChanged.connect(self.filter_table)
+        
+        search_layout.addWidget(search_label)
+        search_layout.addWidget(self.search_input)
+        
+        return search_widget
+
+    def filter_table(self, text):
+        # Строки, номер опоки которых не содержит текст поиска, скрываются
+        self.grid_proxy.setFilterFixedString(text)
+
+    def add_monthly_stats(self):
+        monthly_stats = QWidget()
+        monthly_stats.setObjectName("monthlyStats")
+        layout = QVBoxLayout(monthly_stats)
+        
+        # Добавляем заголовок
+        header = QLabel("Месячная статистика")
+        header.setObjectName("monthlyStatsHeader")
+        layout.addWidget(header)
+        
+        current_month = self.month_dropdown.currentData()
+        usage_history = self.history_store.get()
+        
+        total_uses = sum(int(record.count) for record in usage_history.values())
+        repairs_this_month = self.opoka_data_manager.repairs_in_month(
+            usage_history, current_month
+        )
+        
+        stats_text = (
+            f"Статистика за {self.month_dropdown.currentText()}:\n"
+            f"Всего использований: {total_uses}\n"
+            f"Ремонтов за месяц: {repairs_this_month}"
+        )
+        
+        label = QLabel(stats_text)
+        label.setObjectName("monthlyStatsText")
+        layout.addWidget(label)
+        
+        return monthly_stats
+
+    def add_shadow(self, widget):
+        shadow = QGraphicsDropShadowEffect()
+        shadow.setBlurRadius(10)
+        shadow.setColor(QColor(0, 0, 0, 50))
+        shadow.setOffset(0, 2)
+        widget.setGraphicsEffect(shadow)
+
+    def add_hover_animation(self, widget):
+        """Добавляет анимацию при наведении"""
+        animation = QPropertyAnimation(widget, b"geometry")
+        animation.setDuration(100)
+        animation.setEasingCurve(QEasingCurve.OutCubic)
+        
+        def on_hover_enter():
+            geometry = widget.geometry()
+            animation.setStartValue(geometry)
+            animation.setEndValue(geometry.adjusted(-2, -2, 2, 2))
+            animation.start()
+        
+        def on_hover_leave():
+            geometry = widget.geometry()
+            animation.setStartValue(geometry)
+            animation.setEndValue(geometry.adjusted(2, 2, -2, -2))
+            animation.start()
+        
+        widget.enterEvent = lambda e: on_hover_enter()
+        widget.leaveEvent = lambda e: on_hover_leave()
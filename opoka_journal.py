@@ -0,0 +1,397 @@
+"""Журнал ремонтов опок: только дописываемый файл событий и снимки состояния.
+
+Каждая строка файла - одно событие в JSON:
+
+    repair_out    - опока отправлена в ремонт (дата ремонта)
+    repair_return - опока вернулась из ремонта
+    correction    - ручная поправка: счетчик на дату (count), количество
+                    ремонтов (repair_count), дата ремонта до ведения журнала
+                    (last_repair_date), признак "в ремонте" (in_repair)
+
+Состояние опок (FlaskRepairs) получается проигрыванием событий по порядку, а
+текущий счетчик - вместе с журналом плавок: использования после последнего
+ремонта или поправки. Раз в snapshot_every событий состояние (и количество
+ремонтов по месяцам) сохраняется в снимок вместе с позицией в файле, поэтому
+после перезапуска читается снимок и только события после него. Модуль не зависит от pandas и Qt.
+"""
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+
+REPAIR_OUT = 'repair_out'
+REPAIR_RETURN = 'repair_return'
+CORRECTION = 'correction'
+EVENT_KINDS = (REPAIR_OUT, REPAIR_RETURN, CORRECTION)
+
+# Поля поправки, которые переносятся в состояние опоки
+CORRECTION_FIELDS = ('count', 'repair_count', 'last_repair_date', 'in_repair')
+
+SNAPSHOT_VERSION = 2
+
+
+def check_date(value):
+    if not isinstance(value, str):
+        raise ValueError(f"дата должна быть текстом ГГГГ-ММ-ДД: {value!r}")
+    datetime.strptime(value, '%Y-%m-%d')
+
+
+def check_event(event):
+    """Проверяет поля события; ValueError, если событие нельзя применить"""
+    if not isinstance(event, dict) or event.get('kind') not in EVENT_KINDS or \
+            not isinstance(event.get('seq'), int) or not isinstance(event.get('opoka'), int):
+        raise ValueError("строка не является событием журнала ремонтов")
+    check_date(event.get('date'))
+    for field in ('count', 'repair_count'):
+        if field in event and (not isinstance(event[field], int) or
+                               isinstance(event[field], bool)):
+            raise ValueError(f"{field} должно быть целым числом: {event[field]!r}")
+    if 'last_repair_date' in event:
+        check_date(event['last_repair_date'])
+    if 'in_repair' in event and not isinstance(event['in_repair'], bool):
+        raise ValueError(f"in_repair должно быть true или false: {event['in_repair']!r}")
+
+
+def parse_event(line):
+    """Событие из строки журнала; ValueError, если строка повреждена"""
+    event = json.loads(line)
+    check_event(event)
+    return event
+
+
+class FlaskRepairs:
+    """Состояние одной опоки по журналу ремонтов"""
+    __slots__ = ('repair_dates', 'in_repair', 'correction', 'repair_count_base',
+                 'earlier_repair_date')
+
+    def __init__(self):
+        self.repair_dates = []  # Даты ремонтов ГГГГ-ММ-ДД по возрастанию
+        self.in_repair = False
+        self.correction = None  # (дата, счетчик на конец этой даты)
+        self.repair_count_base = 0  # Ремонты до ведения журнала
+        self.earlier_repair_date = None  # Последний ремонт до ведения журнала
+
+    @property
+    def repair_count(self):
+        return self.repair_count_base + len(self.repair_dates)
+
+    @property
+    def last_repair_date(self):
+        dates = [d for d in (self.earlier_repair_date,
+                             self.repair_dates[-1] if self.repair_dates else None) if d]
+        return max(dates) if dates else None
+
+    def reference(self):
+        """Точка отсчета текущего счетчика: (дата, счетчик на конец даты) или None.
+
+        Счетчик равен значению в точке отсчета плюс использования строго после
+        нее. Поправка действует, только если она не раньше последнего ремонта.
+        """
+        last_repair_date = self.last_repair_date
+        if self.correction is not None and (
+                last_repair_date is None or self.correction[0] >= last_repair_date):
+            return self.correction
+        if last_repair_date is not None:
+            return (last_repair_date, 0)
+        return None
+
+    def apply(self, event):
+        kind = event['kind']
+        if kind == REPAIR_OUT:
+            bisect.insort(self.repair_dates, event['date'])
+            self.in_repair = True
+            # Ремонт, записанный после поправки, сбрасывает счетчик даже задним числом
+            self.correction = None
+        elif kind == REPAIR_RETURN:
+            self.in_repair = False
+        elif kind == CORRECTION:
+            if 'count' in event:
+                self.correction = (event['date'], int(event['count']))
+            if 'repair_count' in event:
+                self.repair_count_base = int(event['repair_count']) - len(self.repair_dates)
+            if 'last_repair_date' in event:
+                self.earlier_repair_date = event['last_repair_date']
+            if 'in_repair' in event:
+                self.in_repair = bool(event['in_repair'])
+
+    def copy(self):
+        flask = FlaskRepairs()
+        flask.repair_dates = list(self.repair_dates)
+        flask.in_repair = self.in_repair
+        flask.correction = self.correction
+        flask.repair_count_base = self.repair_count_base
+        flask.earlier_repair_date = self.earlier_repair_date
+        return flask
+
+    def to_dict(self):
+        return {
+            "repair_dates": self.repair_dates,
+            "in_repair": self.in_repair,
+            "correction": list(self.correction) if self.correction else None,
+            "repair_count_base": self.repair_count_base,
+            "earlier_repair_date": self.earlier_repair_date
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        flask = cls()
+        flask.repair_dates = list(data["repair_dates"])
+        flask.in_repair = data["in_repair"]
+        flask.correction = tuple(data["correction"]) if data["correction"] else None
+        flask.repair_count_base = data["repair_count_base"]
+        flask.earlier_repair_date = data["earlier_repair_date"]
+        return flask
+
+
+class RepairJournal:
+    """Журнал ремонтов в файле path со снимками состояния в snapshot_file.
+
+    state() возвращает копию состояния {номер опоки: FlaskRepairs}; при каждом
+    обращении дочитываются события, дописанные в файл с прошлого раза (в том
+    числе другим процессом). Поврежденные строки пропускаются и перечисляются
+    в skipped: (позиция строки в файле, причина).
+    """
+
+    def __init__(self, path='opoka_repairs.jsonl', snapshot_every=100):
+        self.path = path
+        self.snapshot_file = os.path.splitext(path)[0] + '.snapshot.json'
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self.flasks = None
+        self.seq = 0  # Номер последнего учтенного события
+        self.offset = 0  # Позиция в файле после последнего учтенного события
+        self.since_snapshot = 0
+        self.skipped = []
+        self.month_repairs = {}  # Месяц ГГГГ-ММ -> количество ремонтов
+        # Список всех событий строится при первом запросе events() и дальше
+        # пополняется вместе с состоянием
+        self.event_log = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def has_unread_events(self):
+        """Есть ли в файле события, еще не учтенные в состоянии"""
+        try:
+            return os.path.getsize(self.path) != self.offset
+        except OSError:
+            return self.offset != 0
+
+    def state(self):
+        with self.lock:
+            self._catch_up()
+            return {key: flask.copy() for key, flask in self.flasks.items()}
+
+    def load(self):
+        """Состояние из снимка и событий после него; если снимок не подходит
+        к файлу, журнал проигрывается целиком"""
+        with self.lock:
+            self.flasks = None
+            self.event_log = None
+            if not self._load_snapshot() or not self._read_tail():
+                self.rebuild()
+            elif self.since_snapshot >= self.snapshot_every:
+                self.save_snapshot()
+
+    def rebuild(self):
+        """Проигрывает весь журнал с начала и записывает свежий снимок"""
+        with self.lock:
+            self.flasks, self.seq, self.offset = {}, 0, 0
+            self.skipped = []
+            self.month_repairs = {}
+            self.event_log = []
+            self._read_tail(check_seq=False)
+            self.save_snapshot()
+
+    def events(self):
+        """Все учтенные события журнала по порядку.
+
+        Файл до снимка читается один раз, при первом вызове; дальше список
+        пополняется событиями, дочитанными для состояния.
+        """
+        with self.lock:
+            self._catch_up()
+            if self.event_log is None:
+                self.event_log = self._read_events(self.offset)
+            return list(self.event_log)
+
+    def repairs_in_month(self, month):
+        """Количество ремонтов в месяце month (ГГГГ-ММ), включая ремонты до
+        ведения журнала, перенесенные поправкой"""
+        with self.lock:
+            self._catch_up()
+            return self.month_repairs.get(month, 0)
+
+    def state_as_of(self, date):
+        """Состояние опок {номер опоки: FlaskRepairs} по событиям журнала
+        с датой не позже date (ГГГГ-ММ-ДД), примененным в порядке журнала"""
+        flasks = {}
+        for event in self.events():
+            if event['date'] <= date:
+                flasks.setdefault(event['opoka'], FlaskRepairs()).apply(event)
+        return flasks
+
+    def append(self, kind, opoka_num, date, **fields):
+        """Дописывает событие и возвращает его. date - дата ГГГГ-ММ-ДД"""
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Неизвестное событие журнала ремонтов: {kind}")
+        unknown = set(fields) - set(CORRECTION_FIELDS) - {'note'}
+        if unknown:
+            raise ValueError(f"Неизвестные поля события: {', '.join(sorted(unknown))}")
+
+        with self.lock:
+            # Сначала учитываем события, дописанные другим процессом
+            self._catch_up()
+            event = {
+                "seq": self.seq + 1,
+                "time": datetime.now().isoformat(timespec='seconds'),
+                "kind": kind,
+                "opoka": int(opoka_num),
+                "date": date
+            }
+            event.update(fields)
+            # В файл не попадает событие, которое не прочиталось бы обратно
+            check_event(event)
+            line = (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(event)
+            self.offset += len(line)
+            if self.since_snapshot >= self.snapshot_every:
+                self.save_snapshot()
+            return event
+
+    def migrate(self, history, date):
+        """Переносит состояние опок из истории поправками на дату date.
+
+        Вызывается один раз, пока журнала еще нет: счетчики, ремонты и признак
+        "в ремонте" из истории становятся исходной точкой журнала.
+        """
+        with self.lock:
+            for opoka_num, record in sorted(history.items()):
+                fields = {"count": int(record.count), "in_repair": bool(record.in_repair)}
+                if record.repair_count:
+                    fields["repair_count"] = int(record.repair_count)
+                if record.last_repair_date:
+                    fields["last_repair_date"] = record.last_repair_date
+                self.append(CORRECTION, opoka_num, record.last_use or date,
+                            note="перенос из истории", **fields)
+
+    def save_snapshot(self):
+        with self.lock:
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "seq": self.seq,
+                "offset": self.offset,
+                "skipped": self.skipped,
+                "month_repairs": self.month_repairs,
+                "flasks": {str(key): flask.to_dict() for key, flask in self.flasks.items()}
+            }
+            tmp_file = self.snapshot_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.snapshot_file)
+            self.since_snapshot = 0
+
+    def _catch_up(self):
+        if self.flasks is None:
+            self.load()
+        elif not self._read_tail():
+            # Файл переписали не дописыванием - проигрываем его заново
+            self.rebuild()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                data = json.load(f)
+            if data["version"] != SNAPSHOT_VERSION:
+                return False
+            self.flasks = {int(key): FlaskRepairs.from_dict(value)
+                           for key, value in data["flasks"].items()}
+            self.seq, self.offset = data["seq"], data["offset"]
+            self.skipped = [tuple(item) for item in data["skipped"]]
+            self.month_repairs = dict(data["month_repairs"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.since_snapshot = 0
+        return True
+
+    def _read_events(self, end):
+        """События из первых end байт файла, поврежденные строки пропускаются"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(end)
+        except FileNotFoundError:
+            return []
+        events = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(parse_event(line))
+            except ValueError:
+                continue
+        return events
+
+    def _read_tail(self, check_seq=True):
+        """Применяет события после self.offset. Возвращает False, если файл
+        не продолжает уже учтенные события (обрезан или переписан)"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return self.offset == 0
+        with f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < self.offset:
+                return False
+            if self.offset:
+                # Снимок должен заканчиваться ровно на границе строки
+                f.seek(self.offset - 1)
+                if f.read(1) != b'\n':
+                    return False
+            f.seek(self.offset)
+            after_skipped = False
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Строка еще дописывается
+                    break
+                position = self.offset
+                self.offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    event = parse_event(line)
+                except ValueError as e:
+                    # Поврежденная строка не останавливает журнал, как ячейки
+                    # с ошибками в журнале плавок: она пропускается и попадает в отчет
+                    self.skipped.append((position, str(e)))
+                    after_skipped = True
+                    continue
+                if check_seq and not after_skipped and event["seq"] != self.seq + 1:
+                    return False
+                after_skipped = False
+                self._apply(event)
+        return True
+
+    def _apply(self, event):
+        flask = self.flasks.get(event['opoka'])
+        if flask is None:
+            flask = self.flasks[event['opoka']] = FlaskRepairs()
+        flask.apply(event)
+        if event['kind'] == REPAIR_OUT:
+            self._count_repair(event['date'])
+        elif event['kind'] == CORRECTION and event.get('last_repair_date'):
+            self._count_repair(event['last_repair_date'])
+        if self.event_log is not None:
+            self.event_log.append(event)
+        self.seq = event['seq']
+        self.since_snapshot += 1
+
+    def _count_repair(self, date):
+        month = date[:7]
+        self.month_repairs[month] = self.month_repairs.get(month, 0) + 1
@@ -0,0 +1,168 @@
+"""Состояние опок и конфигурация парка.
+
+Модуль не зависит от pandas и Qt, чтобы команды без расчетов запускались быстро.
+"""
+import json
+from datetime import date, datetime, timedelta
+
+DATE_COLUMN = 'Плавка_дата'
+SECTOR_COLUMNS = ['Сектор_A_опоки', 'Сектор_B_опоки',
+                  'Сектор_C_опоки', 'Сектор_D_опоки']
+REPAIR_LIMIT = 100
+WARNING_THRESHOLD = 80
+CRITICAL_THRESHOLD = 91
+
+# Пустая ячейка сектора и пустая дата в компактном представлении журнала
+EMPTY_OPOKA = 0
+EMPTY_DAY = -2 ** 31  # минимальное значение int32
+
+# Даты в компактном журнале - номера дней от EPOCH
+EPOCH = date(1970, 1, 1)
+
+
+def to_day(value):
+    """Дата (date, datetime или текст ГГГГ-ММ-ДД) в номер дня от 1970-01-01"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def day_to_date(day):
+    """Номер дня от 1970-01-01 в date"""
+    return EPOCH + timedelta(days=int(day))
+
+
+class FleetConfig:
+    """Конфигурация парка опок: номера опок, колонки секторов журнала плавок,
+    лимит использований до ремонта и пороги подсветки счетчика"""
+    __slots__ = ('opoka_nums', 'sector_columns', 'repair_limit',
+                 'warning_threshold', 'critical_threshold')
+
+    def __init__(self, opoka_nums=range(1, 12), sector_columns=SECTOR_COLUMNS,
+                 repair_limit=REPAIR_LIMIT, warning_threshold=WARNING_THRESHOLD,
+                 critical_threshold=CRITICAL_THRESHOLD):
+        self.opoka_nums = [int(i) for i in opoka_nums]
+        self.sector_columns = list(sector_columns)
+        self.repair_limit = repair_limit
+        self.warning_threshold = warning_threshold
+        self.critical_threshold = critical_threshold
+
+    @classmethod
+    def load(cls, path='fleet_config.json'):
+        """Читает конфигурацию из JSON; если файла нет, используется парк по умолчанию.
+
+        Опоки задаются списком "opoka_nums" или количеством "opoka_count"
+        (тогда номера 1..opoka_count).
+        """
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+
+        opoka_nums = data.get('opoka_nums') or range(1, data.get('opoka_count', 11) + 1)
+        return cls(
+            opoka_nums,
+            data.get('sector_columns', SECTOR_COLUMNS),
+            data.get('repair_limit', REPAIR_LIMIT),
+            data.get('warning_threshold', WARNING_THRESHOLD),
+            data.get('critical_threshold', CRITICAL_THRESHOLD)
+        )
+
+
+class OpokaRecord:
+    """Текущее состояние одной опоки"""
+    __slots__ = ('count', 'total_count', 'repair_count', 'last_use',
+                 'last_repair_date', 'in_repair', 'auto_reset', 'unused_days')
+
+    def __init__(self, count=0, total_count=0, repair_count=0, last_use=None,
+                 last_repair_date=None, in_repair=False, auto_reset=None,
+                 unused_days=None):
+        self.count = count
+        self.total_count = total_count
+        self.repair_count = repair_count
+        self.last_use = last_use
+        self.last_repair_date = last_repair_date  # Дата последнего ремонта
+        self.in_repair = in_repair
+        self.auto_reset = auto_reset
+        self.unused_days = unused_days
+
+    def to_dict(self):
+        """Словарь для сохранения в JSON; необязательные поля пишутся, только если заданы"""
+        data = {
+            "count": self.count,
+            "total_count": self.total_count,
+            "repair_count": self.repair_count,
+            "last_use": self.last_use,
+            "last_repair_date": self.last_repair_date,
+            "in_repair": self.in_repair
+        }
+        if self.auto_reset is not None:
+            data["auto_reset"] = self.auto_reset
+        if self.unused_days is not None:
+            data["unused_days"] = self.unused_days
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def __eq__(self, other):
+        if not isinstance(other, OpokaRecord):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self):
+        return f"OpokaRecord({self.to_dict()})"
+
+
+def empty_history(opoka_nums):
+    """Создает пустую историю использования для переданных опок"""
+    return {int(i): OpokaRecord() for i in opoka_nums}
+
+
+def record_state(record, fleet):
+    """Состояние опоки для подсветки: repair, idle, critical, warning или normal"""
+    if record.in_repair:
+        return "repair"
+    elif record.auto_reset:
+        return "idle"
+    elif int(record.count) >= fleet.critical_threshold:
+        return "critical"
+    elif int(record.count) >= fleet.warning_threshold:
+        return "warning"
+    return "normal"
+
+
+def status_text(record):
+    if record.in_repair:
+        return "В ремонте"
+    elif record.auto_reset:
+        return f"Простой ({record.unused_days or 0} дней)"
+    return "Готова"
+
+
+def status_dict(opoka_num, record, fleet):
+    """Состояние опоки для выдачи в JSON"""
+    return dict(record.to_dict(), opoka=opoka_num,
+                state=record_state(record, fleet),
+                status=status_text(record))
+
+
+def statistics_rows(history, opoka_nums):
+    """Строки выгрузки статистики по опокам"""
+    rows = []
+    for i in opoka_nums:
+        record = history[i]
+        rows.append({
+            'Номер опоки': i,
+            'Текущие использования': record.count,
+            'Всего использований': record.total_count,
+            'Количество ремонтов': record.repair_count,
+            'Последний ремонт': record.last_repair_date,
+            'Последнее использование': record.last_use,
+            'Статус': status_text(record)
+        })
+    return rows
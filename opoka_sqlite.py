@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+
+from opoka_data import OpokaDataManager, file_content_hash
+from opoka_journal import CORRECTION, REPAIR_OUT, FlaskRepairs
+from opoka_records import (EMPTY_DAY, EMPTY_OPOKA, OpokaRecord, day_to_date, empty_history,
+                           to_day)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS melt_usages (
+    row INTEGER NOT NULL,
+    flask INTEGER NOT NULL,
+    day INTEGER  -- NULL у плавки без даты
+);
+CREATE INDEX IF NOT EXISTS idx_melt_usages_flask_day ON melt_usages (flask, day);
+
+-- События ремонтов хранятся в журнале ремонтов, как и у JSON-хранилища;
+-- таблица repair_events прежних версий переносится в него (migrate_repairs)
+
+CREATE TABLE IF NOT EXISTS flask_state (
+    flask INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total_count INTEGER NOT NULL,
+    repair_count INTEGER NOT NULL,
+    last_use TEXT,
+    last_repair_date TEXT,
+    in_repair INTEGER NOT NULL,
+    extra TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+STATE_FIELDS = ["count", "total_count", "repair_count", "last_use",
+                "last_repair_date", "in_repair"]
+
+
+def synchronized(method):
+    """Выполняет метод под блокировкой соединения: к базе обращаются
+    и окно, и фоновый расчет"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SqliteDataManager(OpokaDataManager):
+    """Хранилище истории опок в SQLite.
+
+    Кроме текущего состояния опок хранит все использования из журнала плавок,
+    поэтому последнее использование и использования после даты считаются
+    индексными запросами. Ремонты, как и у JSON-хранилища, берутся из журнала
+    ремонтов. При первом запуске данные переносятся из opoka_usage_history.json.
+    """
+
+    def __init__(self, db_file='opoka_usage.db', fleet=None):
+        super().__init__(fleet)
+        self.db_file = db_file
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.upgrade_schema()
+
+        if self.get_meta('migrated') is None:
+            self.migrate_from_json()
+
+    def get_meta(self, key):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def upgrade_schema(self):
+        """Базы прежних версий хранили только использования с датой плавки:
+        таблица использований пересоздается и заполняется при следующей загрузке"""
+        columns = self.connection.execute("PRAGMA table_info(melt_usages)").fetchall()
+        if any(name == 'day' and notnull for _, name, _, notnull, _, _ in columns):
+            with self.connection:
+                self.connection.execute("DROP TABLE melt_usages")
+                self.connection.execute("DELETE FROM meta WHERE key = 'usages_hash'")
+            self.connection.executescript(SCHEMA)
+
+    def migrate_from_json(self):
+        """Однократно переносит историю из JSON; журнал плавок переносится
+        при первой загрузке load_plavka()"""
+        with self.connection:
+            if os.path.exists(self.filename):
+                history = super().load_history()
+                self._write_state(history, history.keys())
+            self.set_meta('migrated', datetime.now().isoformat())
+
+    @synchronized
+    def migrate_repairs(self, history):
+        """Кроме переноса истории в журнал ремонтов один раз переносит в него
+        ремонты из таблицы repair_events прежних версий.
+
+        В журнал дописываются только ремонты, которых в нем нет, а затем
+        поправка возвращает опоке прежние счетчик, количество ремонтов и
+        признак "в ремонте": они уже учитывали эти ремонты.
+        """
+        super().migrate_repairs(history)
+        if self.get_meta('repair_events_migrated') is not None:
+            return
+
+        table = self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'repair_events'"
+        ).fetchone()
+        if table is not None:
+            repairs = self.repair_journal.state()
+            missing = {}
+            for flask, day in self.connection.execute(
+                    "SELECT flask, day FROM repair_events WHERE kind = 'repair' ORDER BY day, id"):
+                repair_date = day_to_date(day).isoformat()
+                known = repairs.get(flask) or FlaskRepairs()
+                if repair_date in known.repair_dates or repair_date == known.earlier_repair_date:
+                    continue
+                missing.setdefault(flask, []).append(repair_date)
+
+            for flask, dates in sorted(missing.items()):
+                before = repairs.get(flask) or FlaskRepairs()
+                for repair_date in dates:
+                    self.repair_journal.append(REPAIR_OUT, flask, repair_date,
+                                               note="перенос из базы")
+                fields = {"repair_count": before.repair_count, "in_repair": before.in_repair}
+                correction_date = dates[-1]
+                if before.correction is not None:
+                    correction_date, fields["count"] = before.correction
+                self.repair_journal.append(CORRECTION, flask, correction_date,
+                                           note="перенос из базы", **fields)
+
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS repair_events")
+            self.set_meta('repair_events_migrated', datetime.now().isoformat())
+
+    def watched_files(self):
+        return [self.excel_file, self.repair_journal.path]
+
+    def history_file_stat(self):
+        # История хранится в базе, отслеживать файл не нужно
+        return None
+
+    @synchronized
+    def load_history(self):
+        rows = self.connection.execute(
+            f"SELECT flask, {', '.join(STATE_FIELDS)}, extra FROM flask_state ORDER BY flask"
+        ).fetchall()
+        if not rows:
+            return empty_history(self.fleet.opoka_nums)
+
+        history = empty_history(self.fleet.opoka_nums)
+        for flask, *values, extra in rows:
+            data = dict(zip(STATE_FIELDS, values))
+            data["in_repair"] = bool(data["in_repair"])
+            if extra:
+                data.update(json.loads(extra))
+            history[flask] = OpokaRecord.from_dict(data)
+        return history
+
+    @synchronized
+    def save_history(self, history, opoka_nums=None):
+        keys = history.keys() if opoka_nums is None else [int(i) for i in opoka_nums]
+        with self.connection:
+            self._write_state(history, keys)
+
+    def _write_state(self, history, keys):
+        rows = []
+        for key in keys:
+            data = history[key].to_dict()
+            extra = {k: v for k, v in data.items() if k not in STATE_FIELDS}
+            rows.append((
+                key, *(data[field] for field in STATE_FIELDS),
+                json.dumps(extra) if extra else None
+            ))
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO flask_state (flask, {', '.join(STATE_FIELDS)}, extra) "
+            f"VALUES ({', '.join('?' * (len(STATE_FIELDS) + 2))})",
+            rows
+        )
+
+    @synchronized
+    def load_plavka(self, content_hash=None):
+        if content_hash is None:
+            content_hash = file_content_hash(self.excel_file)
+        super().load_plavka(content_hash)
+        usages_hash = self.get_meta('usages_hash')
+        # Журнал перечитывается и при смене парка (номера не из парка не
+        # учитываются), тогда использования тоже переносятся заново
+        fleet = json.dumps(sorted(self.fleet.opoka_nums))
+        if usages_hash != content_hash or self.get_meta('usages_fleet') != fleet:
+            # Если к журналу, уже перенесенному в базу, только дописали строки,
+            # в таблицу добавляются лишь они
+            start = 0
+            if self.appended is not None and self.appended[0] == usages_hash:
+                start = self.appended[1]
+            self.sync_usages(content_hash, start)
+
+    def sync_usages(self, content_hash, start=0):
+        """Записывает в таблицу использования строк загруженного журнала с
+        позиции start; при start=0 таблица перезаписывается целиком"""
+        days, opokas, _ = self.rows
+        rows, cols = np.nonzero(opokas[start:] != EMPTY_OPOKA)
+        usage_days = days[start:][rows].tolist()
+        with self.connection:
+            if start == 0:
+                self.connection.execute("DELETE FROM melt_usages")
+            else:
+                self.connection.execute("DELETE FROM melt_usages WHERE row >= ?", (start,))
+            self.connection.executemany(
+                "INSERT INTO melt_usages (row, flask, day) VALUES (?, ?, ?)",
+                zip((rows + start).tolist(), opokas[start:][rows, cols].tolist(),
+                    [None if day == EMPTY_DAY else day for day in usage_days])
+            )
+            self.set_meta('usages_hash', content_hash)
+            self.set_meta('usages_fleet', json.dumps(sorted(self.fleet.opoka_nums)))
+
+    @synchronized
+    def last_use(self, opoka_num):
+        import pandas as pd
+
+        row = self.connection.execute(
+            "SELECT MAX(day) FROM melt_usages WHERE flask = ?", (opoka_num,)
+        ).fetchone()
+        return pd.Timestamp(day_to_date(row[0])) if row[0] is not None else None
+
+    @synchronized
+    def uses_since(self, opoka_num, date):
+        """Количество использований опоки строго после даты date"""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM melt_usages WHERE flask = ? AND day > ?",
+            (opoka_num, to_day(date))
+        ).fetchone()[0]
+
+    @synchronized
+    def usage_stats(self, opoka_nums, repair_dates):
+        import pandas as pd
+
+        repair_dates = repair_dates or {}
+        records = []
+        for opoka_num in opoka_nums:
+            last_day, total = self.connection.execute(
+                "SELECT MAX(day), COUNT(*) FROM melt_usages WHERE flask = ?", (opoka_num,)
+            ).fetchone()
+            since_repair = 0
+            if opoka_num in repair_dates:
+                since_repair = self.uses_since(opoka_num, repair_dates[opoka_num])
+            records.append({
+                'opoka': opoka_num,
+                'last_use': pd.Timestamp(day_to_date(last_day)) if last_day is not None else pd.NaT,
+                'total_uses': total,
+                'uses_since_repair': since_repair
+            })
+        columns = ['opoka', 'last_use', 'total_uses', 'uses_since_repair']
+        return pd.DataFrame(records, columns=columns).set_index('opoka')
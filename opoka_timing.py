@@ -0,0 +1,128 @@
+"""Замеры времени этапов обработки данных.
+
+Этапы размечаются контекстом span(name). Если в потоке активна трасса
+(activate), время этапа добавляется в нее: так окно собирает разбивку
+последнего обновления для строки состояния. Вложенные этапы получают имя
+вида "load/read_excel".
+
+Запись в журнал включается переменной окружения OPOKA_TIMING=1 или флагом
+--timing (enable()). Журнал - файл JSON Lines с ротацией по размеру; каждая
+завершенная трасса или этап вне трассы записывается одной строкой.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_FILE = 'opoka_timing.jsonl'
+
+# Журнал создается только при включении замеров, чтобы не импортировать
+# logging при каждом запуске
+logger = None
+
+_local = threading.local()
+
+
+def enable(path=LOG_FILE, max_bytes=1024 * 1024, backup_count=3):
+    """Включает запись замеров в журнал path"""
+    global logger
+    if logger is not None:
+        return
+    import logging
+    from logging.handlers import RotatingFileHandler
+
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                  encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('opoka.timing')
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def is_enabled():
+    return logger is not None
+
+
+def write(entry):
+    if logger is not None:
+        entry = dict(time=datetime.now().isoformat(timespec='milliseconds'), **entry)
+        logger.info(json.dumps(entry, ensure_ascii=False))
+
+
+class Trace:
+    """Разбивка по этапам одной операции (например, обновления окна)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []  # (имя этапа, мс) в порядке завершения
+        self.error = None
+        self.started = time.perf_counter()
+        self.total_ms = None
+
+    def add(self, name, ms):
+        self.spans.append((name, ms))
+
+    def top_level(self):
+        """Этапы верхнего уровня; повторяющиеся этапы суммируются"""
+        totals = {}
+        for name, ms in self.spans:
+            if '/' not in name:
+                totals[name] = totals.get(name, 0) + ms
+        return totals
+
+    def finish(self, error=None):
+        """Завершает трассу и записывает ее в журнал, если он включен"""
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        self.error = error
+        entry = {
+            "trace": self.name,
+            "total_ms": round(self.total_ms, 2),
+            "spans": [[name, round(ms, 2)] for name, ms in self.spans]
+        }
+        if error is not None:
+            entry["error"] = error
+        write(entry)
+        return self
+
+    def summary(self):
+        """Краткая строка вида 'load 120 мс, render_table 15 мс'"""
+        return ", ".join(f"{name} {ms:.0f} мс" for name, ms in self.top_level().items())
+
+
+@contextmanager
+def activate(trace):
+    """Делает trace текущей трассой потока на время блока"""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name):
+    """Замеряет время блока как этап name"""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    full_name = '/'.join(stack)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        stack.pop()
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.add(full_name, ms)
+        else:
+            write({"span": full_name, "ms": round(ms, 2)})
+
+
+if os.environ.get('OPOKA_TIMING', '') not in ('', '0'):
+    enable()
@@ -0,0 +1,204 @@
+"""Одинаковые проверки для JSON- и SQLite-хранилища."""
+import atexit
+from datetime import date, datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from opoka_data import (DataCache, HistoryStore, apply_usage_stats, collect_repair_dates,
+                        create_data_manager, record_repair)
+from opoka_export import export_table
+from opoka_journal import CORRECTION, REPAIR_OUT, REPAIR_RETURN
+from opoka_records import DATE_COLUMN, SECTOR_COLUMNS, FleetConfig
+
+OPOKA_NUMS = [1, 2, 3, 4]
+
+# Дата плавки и опоки секторов A-D; четвертая плавка без даты, в пятой
+# нечисловая ячейка (попадает в отчет об ошибках)
+ROWS = [
+    ('01.03.2024', 1, 2, None, None),
+    ('02.03.2024', 1, 3, None, None),
+    ('15.03.2024', 2, None, 1, None),
+    (None, 1, None, None, None),
+    ('01.04.2024', 'x', 3, None, None),
+]
+
+
+def write_plavka(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append([DATE_COLUMN] + SECTOR_COLUMNS)
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def manager(request, tmp_path, monkeypatch):
+    # Хранилища работают с файлами в текущем каталоге
+    monkeypatch.chdir(tmp_path)
+    write_plavka('plavka.xlsx', ROWS)
+    data_manager = create_data_manager(request.param, FleetConfig(OPOKA_NUMS))
+    yield data_manager
+    if request.param == 'sqlite':
+        data_manager.connection.close()
+
+
+@pytest.fixture
+def history_store(manager):
+    # Историю записываем, пока каталог теста текущий: запись при выходе
+    # из интерпретатора попала бы в каталог запуска pytest
+    store = HistoryStore(manager)
+    yield store
+    store.flush()
+    atexit.unregister(store.flush)
+
+
+def test_usage_stats(manager):
+    manager.load_plavka()
+    stats = manager.usage_stats(OPOKA_NUMS, {1: datetime(2024, 3, 1)})
+
+    assert stats['total_uses'].tolist() == [4, 2, 2, 0]
+    assert stats.at[1, 'uses_since_repair'] == 2
+    assert stats.at[2, 'uses_since_repair'] == 0
+    assert stats['last_use'].tolist()[:3] == [pd.Timestamp('2024-03-15'),
+                                              pd.Timestamp('2024-03-15'),
+                                              pd.Timestamp('2024-04-01')]
+    assert pd.isna(stats.at[4, 'last_use'])
+    assert len(manager.quarantine) == 1
+
+
+def test_last_use(manager):
+    manager.load_plavka()
+    assert manager.last_use(3) == pd.Timestamp('2024-04-01')
+    assert manager.last_use(4) is None or pd.isna(manager.last_use(4))
+
+
+def test_uses_since(manager):
+    manager.load_plavka()
+    assert manager.uses_since(1, datetime(2024, 3, 1)) == 2
+    assert manager.uses_since(1, datetime(2024, 3, 15)) == 0
+    assert manager.uses_since(3, datetime(2024, 1, 1)) == 2
+
+
+def test_appended_rows(manager):
+    manager.load_plavka()
+    write_plavka('plavka.xlsx', ROWS + [('02.04.2024', 4, 1, None, None)])
+
+    manager.load_plavka()
+    assert manager.appended is not None
+    stats = manager.usage_stats(OPOKA_NUMS, {})
+    assert stats['total_uses'].tolist() == [5, 2, 2, 1]
+    assert manager.uses_since(1, datetime(2024, 4, 1)) == 1
+
+
+def test_edited_rows_rebuild(manager):
+    manager.load_plavka()
+    rows = list(ROWS)
+    rows[0] = ('01.03.2024', 4, 2, None, None)
+    write_plavka('plavka.xlsx', rows + [('02.04.2024', 4, None, None, None)])
+
+    manager.load_plavka()
+    assert manager.appended is None
+    assert manager.usage_stats(OPOKA_NUMS, {})['total_uses'].tolist() == [3, 2, 2, 2]
+
+
+def test_fleet_growth_rebuilds_sidecar(manager):
+    # Опоки 300 нет в парке из четырех опок, она попадает в отчет
+    write_plavka('plavka.xlsx', ROWS + [('02.04.2024', 300, None, None, None)])
+    manager.load_plavka()
+    assert len(manager.quarantine) == 2
+
+    manager.fleet = FleetConfig(OPOKA_NUMS + [300])
+    manager.load_plavka()
+    assert len(manager.quarantine) == 1
+    assert manager.usage_stats([300], {})['total_uses'].tolist() == [1]
+    assert manager.last_use(300) == pd.Timestamp('2024-04-02')
+
+
+def test_unknown_opoka_quarantined(manager):
+    # Опечатка в номере не растягивает агрегаты до него
+    write_plavka('plavka.xlsx', ROWS + [('02.04.2024', 65000, 4, None, None)])
+    manager.load_plavka()
+    assert [cell.value for cell in manager.quarantine] == ['x', 65000]
+    assert manager.aggregates.total_uses.tolist() == [4, 2, 2, 1]
+    assert manager.aggregates.month_grid(2024, 4, [65000, 4]).sum(axis=1).tolist() == [0, 1]
+    assert manager.usage_stats([65000], {})['total_uses'].tolist() == [0]
+
+
+def test_usage_export_sheet_rows(manager):
+    # Строки журнала в выгрузке - номера строк листа, пустая строка не сдвигает их
+    write_plavka('plavka.xlsx', ROWS[:2] + [(None,) * 5] + ROWS[2:])
+    manager.load_plavka()
+    history = manager.load_history()
+
+    assert export_table('usages.csv', 'usages', DataCache(manager), history) == 8
+    usages = pd.read_csv('usages.csv', encoding='utf-8-sig')
+    assert usages.iloc[:, 0].tolist() == [2, 2, 3, 3, 5, 5, 6, 7]
+    assert usages.iloc[:, 3].tolist() == [1, 2, 1, 3, 2, 1, 1, 3]
+
+
+def test_repair_history(manager, history_store):
+    record_repair(manager, history_store, REPAIR_OUT, 2, '2024-03-20')
+    record_repair(manager, history_store, REPAIR_RETURN, 2, '2024-03-22')
+    record_repair(manager, history_store, CORRECTION, 3, '2024-04-02', count=10,
+                  last_repair_date='2024-02-01')
+    history_store.flush()
+    history = history_store.get()
+
+    assert manager.repair_history(history) == [
+        (3, '2024-02-01', 'repair'),
+        (2, '2024-03-20', 'repair'),
+        (2, '2024-03-22', 'return'),
+        (3, '2024-04-02', 'correction'),
+    ]
+    assert manager.repairs_in_month(history, '2024-03') == 1
+    assert manager.repairs_in_month(history, '2024-02') == 1
+    assert history[2].repair_count == 1
+    assert not history[2].in_repair
+    assert history[3].count == 10
+
+
+def test_state_as_of(manager, history_store):
+    record_repair(manager, history_store, REPAIR_OUT, 1, '2024-03-01')
+    record_repair(manager, history_store, CORRECTION, 3, '2024-03-10', count=37)
+    manager.load_plavka()
+
+    # До поправки счетчик опоки 3 считается по журналу плавок
+    states = manager.state_as_of(date(2024, 3, 5), OPOKA_NUMS)
+    assert [states[i].count for i in OPOKA_NUMS] == [1, 1, 1, 0]
+    assert states[3].last_use == '2024-03-02'
+
+    states = manager.state_as_of(date(2024, 3, 20), OPOKA_NUMS)
+    assert [states[i].count for i in OPOKA_NUMS] == [2, 2, 37, 0]
+    assert [states[i].total_count for i in OPOKA_NUMS] == [3, 2, 1, 0]
+    assert states[1].repair_count == 1 and states[1].in_repair
+    assert states[1].last_repair_date == '2024-03-01'
+
+    assert manager.state_as_of(date(2024, 4, 30), [3])[3].count == 38
+    assert manager.state_as_of(date(2024, 2, 1), [1])[1].repair_count == 0
+
+
+def test_apply_usage_stats(manager, history_store):
+    record_repair(manager, history_store, REPAIR_OUT, 1, '2024-03-01')
+    repairs = manager.load_repairs()
+    repair_dates = collect_repair_dates(repairs, OPOKA_NUMS)
+    manager.load_plavka()
+    stats = manager.usage_stats(OPOKA_NUMS, repair_dates)
+    over_limit = apply_usage_stats(history_store, stats, repairs, OPOKA_NUMS, 2)
+
+    history = history_store.get()
+    assert [history[i].count for i in OPOKA_NUMS] == [2, 2, 2, 0]
+    assert [history[i].total_count for i in OPOKA_NUMS] == [4, 2, 2, 0]
+    assert history[1].repair_count == 1
+    assert history[1].last_use == '2024-03-15'
+    # Опока 1 в ремонте и не попадает в список достигших лимита
+    assert over_limit == [2, 3]
+
+
+def test_history_roundtrip(manager, history_store):
+    history_store.update(1, count=7, last_use='2024-03-15')
+    history_store.flush()
+    assert manager.load_history()[1].count == 7
+    assert manager.load_history()[1].last_use == '2024-03-15'
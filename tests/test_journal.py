@@ -0,0 +1,90 @@
+"""Журнал ремонтов: поврежденные строки пропускаются и попадают в отчет."""
+import json
+
+import pytest
+
+from opoka_journal import CORRECTION, REPAIR_OUT, RepairJournal, parse_event
+
+GOOD = [
+    {"seq": 1, "kind": "repair_out", "opoka": 1, "date": "2024-01-10"},
+    {"seq": 2, "kind": "correction", "opoka": 2, "date": "2024-01-12", "count": 5},
+]
+
+CORRUPT = [
+    b'{"seq": 3, "kind": "repair_out", "opoka": 1, "date": 20240102}',
+    b'{"seq": 3, "kind": "correction", "opoka": 2, "date": "2024-01-13", "count": "abc"}',
+    b'{"seq": 3, "kind": "correction", "opoka": 2, "date": "2024-01-13", "repair_count": 1.5}',
+    b'{"seq": 3, "kind": "correction", "opoka": 2, "date": "2024-01-13", "in_repair": "no"}',
+    b'{"seq": 3, "kind": "correction", "opoka": 2, "date": "2024-01-13",'
+    b' "last_repair_date": "13.01.2024"}',
+    b'{"seq": 3, "kind": "repair_out", "opoka": "1", "date": "2024-01-13"}',
+    b'{"seq": 3, "kind": "scrap", "opoka": 1, "date": "2024-01-13"}',
+    b'[1, 2, 3]',
+    b'{"seq": 3, "kind": "repair_out"',
+    b'\xff\xfe',
+]
+
+
+def write_lines(path, lines):
+    with open(path, 'wb') as f:
+        for line in lines:
+            f.write((line if isinstance(line, bytes) else json.dumps(line).encode()) + b'\n')
+
+
+@pytest.mark.parametrize('line', CORRUPT)
+def test_parse_event_rejects_corrupt_line(line):
+    with pytest.raises(ValueError):
+        parse_event(line)
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    path = tmp_path / 'opoka_repairs.jsonl'
+    tail = {"seq": 3, "kind": "repair_return", "opoka": 1, "date": "2024-01-20"}
+    write_lines(path, GOOD + CORRUPT + [tail])
+
+    journal = RepairJournal(str(path))
+    state = journal.state()
+    assert not state[1].in_repair
+    assert state[1].repair_dates == ['2024-01-10']
+    assert state[2].correction == ('2024-01-12', 5)
+    assert len(journal.skipped) == len(CORRUPT)
+    assert [event['seq'] for event in journal.events()] == [1, 2, 3]
+
+
+def test_corrupt_line_after_snapshot(tmp_path):
+    path = tmp_path / 'opoka_repairs.jsonl'
+    journal = RepairJournal(str(path), snapshot_every=1)
+    journal.append(REPAIR_OUT, 1, '2024-01-10')
+    with open(path, 'ab') as f:
+        f.write(CORRUPT[1] + b'\n')
+
+    # Новый экземпляр читает снимок и дописанный после него хвост
+    journal = RepairJournal(str(path), snapshot_every=1)
+    assert journal.state()[1].in_repair
+    assert len(journal.skipped) == 1
+    journal.append(CORRECTION, 1, '2024-01-15', count=3)
+    assert journal.state()[1].correction == ('2024-01-15', 3)
+
+
+def test_append_rejects_invalid_fields(tmp_path):
+    journal = RepairJournal(str(tmp_path / 'opoka_repairs.jsonl'))
+    with pytest.raises(ValueError):
+        journal.append(CORRECTION, 1, '2024-01-15', count='abc')
+    with pytest.raises(ValueError):
+        journal.append(REPAIR_OUT, 1, '15.01.2024')
+    assert not journal.exists()
+
+
+def test_repairs_in_month_from_snapshot(tmp_path):
+    path = str(tmp_path / 'opoka_repairs.jsonl')
+    journal = RepairJournal(path, snapshot_every=2)
+    journal.append(REPAIR_OUT, 1, '2024-01-10')
+    journal.append(CORRECTION, 2, '2024-02-05', count=3, last_repair_date='2024-01-20')
+    journal.append(REPAIR_OUT, 2, '2024-02-07')
+
+    # Счетчики берутся из снимка и хвоста после него, без списка всех событий
+    journal = RepairJournal(path, snapshot_every=2)
+    assert journal.repairs_in_month('2024-01') == 2
+    assert journal.repairs_in_month('2024-02') == 1
+    assert journal.repairs_in_month('2024-03') == 0
+    assert journal.event_log is None
@@ -0,0 +1,53 @@
+"""SQLite-хранилище: перенос таблицы repair_events прежних версий в журнал ремонтов."""
+import sqlite3
+
+from opoka_records import FleetConfig, OpokaRecord, to_day
+from opoka_sqlite import SqliteDataManager
+
+# Таблица ремонтов из прежних версий хранилища
+LEGACY_SCHEMA = """
+CREATE TABLE repair_events (
+    id INTEGER PRIMARY KEY,
+    flask INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    kind TEXT NOT NULL
+);
+"""
+
+
+def test_repair_events_migrated_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    connection = sqlite3.connect('opoka_usage.db')
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executemany(
+        "INSERT INTO repair_events (flask, day, kind) VALUES (?, ?, 'repair')",
+        [(2, to_day('2024-01-05')), (2, to_day('2024-02-10'))]
+    )
+    connection.commit()
+    connection.close()
+
+    # Открытие базы таблицу не удаляет
+    manager = SqliteDataManager(fleet=FleetConfig([1, 2]))
+    manager.connection.close()
+    manager = SqliteDataManager(fleet=FleetConfig([1, 2]))
+    history = manager.load_history()
+    history[2] = OpokaRecord(count=5, total_count=30, repair_count=2, last_use='2024-03-15',
+                             last_repair_date='2024-02-10')
+    manager.save_history(history)
+
+    manager.migrate_repairs(history)
+    flask = manager.load_repairs()[2]
+    assert flask.repair_count == 2
+    assert flask.last_repair_date == '2024-02-10'
+    assert not flask.in_repair
+    assert flask.reference() == ('2024-03-15', 5)
+    assert manager.repairs_in_month(history, '2024-01') == 1
+    assert manager.repairs_in_month(history, '2024-02') == 1
+
+    events = manager.repair_journal.events()
+    manager.migrate_repairs(history)
+    assert manager.repair_journal.events() == events
+    assert manager.connection.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'repair_events'"
+    ).fetchone() is None
+    manager.connection.close()